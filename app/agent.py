@@ -1,80 +1,194 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from app.embeddings import EmbeddingModel
-from app.qdrant_client_wrapper import QdrantHandler
+from app.qdrant_client_wrapper import QdrantHandler, get_qdrant_handler
 from app.memory import MemoryManager
-from app.schemas import AgentQueryRequest, AgentResponse, SearchResultItem
+from app.schemas import AgentQueryRequest, AgentResponse, SearchResultItem, BatchAgentQueryRequest, BatchAgentResponse
 from app.llm_service import LLMService
+from app.metrics import span
+import asyncio
+import numpy as np
+import os
 import uuid
 
+THRESHOLD = 0.20 # Adjusted for MiniLM cosine similarity range
+MODERATE_THRESHOLD = 0.15 # Lower fallback threshold
+# Detect Visual Intent (Simple Heuristic or use LLM later)
+VISUAL_KEYWORDS = ["show", "image", "picture", "diagram", "scan", "photo", "see"]
+# Concurrent LLM calls while answering a batch with include_llm
+BATCH_LLM_CONCURRENCY = int(os.getenv("HEALTHGUARD_BATCH_LLM_CONCURRENCY", "8"))
+
+# Answer tiers: "tiered" answers decisive verdicts from the template and only calls the LLM for
+# ambiguous ones; "llm" always calls it (cache permitting); "template" never does
+ANSWER_POLICY = os.getenv("HEALTHGUARD_ANSWER_POLICY", "tiered")
+ANSWER_POLICIES = ("tiered", "llm", "template")
+# Decisive = a fact/myth/image rule fired with at least this score, beating the runner-up by this margin
+DECISIVE_SCORE = float(os.getenv("HEALTHGUARD_DECISIVE_SCORE", "0.6"))
+DECISIVE_MARGIN = float(os.getenv("HEALTHGUARD_DECISIVE_MARGIN", "0.25"))
+# Image rules compare CLIP text-image similarities, which sit far lower than MiniLM text-text ones
+# (a good match is ~0.3): own threshold, with the margin taken over the next image hit
+DECISIVE_IMAGE_SCORE = float(os.getenv("HEALTHGUARD_DECISIVE_IMAGE_SCORE", "0.3"))
+DECISIVE_IMAGE_MARGIN = float(os.getenv("HEALTHGUARD_DECISIVE_IMAGE_MARGIN", "0.03"))
+# For templated answers, generate the LLM phrasing in the background so repeats get it from the cache
+ANSWER_BACKGROUND_FILL = os.getenv("HEALTHGUARD_ANSWER_BACKGROUND_FILL", "true").lower() in ("1", "true", "yes")
+
+def has_visual_intent(query: str) -> bool:
+    return any(keyword in query.lower() for keyword in VISUAL_KEYWORDS)
+
+def _top_score(hits) -> float:
+    return hits[0].score if hits else 0.0
+
+def verdict_rules(fact_scores, misinfo_scores, image_scores, visual_intent) -> np.ndarray:
+    """
+    Which verdict rule fires for each claim, evaluated over whole arrays of top scores.
+    Rules are checked in priority order; the first match wins (like an if/elif chain).
+    """
+    f, m, i = (np.asarray(x, dtype=np.float64) for x in (fact_scores, misinfo_scores, image_scores))
+    v = np.asarray(visual_intent, dtype=bool)
+    return np.select(
+        [v & (i > THRESHOLD),
+         (f > THRESHOLD) & (f > m),
+         (m > THRESHOLD) & (m > f),
+         i > THRESHOLD,
+         (f > MODERATE_THRESHOLD) | (m > MODERATE_THRESHOLD)],
+        ["visual", "fact", "misinfo", "image", "moderate"],
+        default="none"
+    )
+
+def is_decisive(rule: str, fact_score: float, misinfo_score: float, image_score: float,
+                image_runner_up: float = 0.0) -> bool:
+    """
+    Whether the templated answer is as good as an LLM rewrite (see DECISIVE_SCORE / DECISIVE_MARGIN).
+    Image rules use DECISIVE_IMAGE_SCORE / DECISIVE_IMAGE_MARGIN against `image_runner_up`, the
+    second image hit's score: fact scores live in a different embedding space.
+    """
+    if rule == "none":
+        # Nothing to ground an answer on: the LLM could only say "I don't know" too
+        return True
+    if rule == "moderate":
+        return False
+    if rule in ("visual", "image"):
+        return image_score >= DECISIVE_IMAGE_SCORE and image_score - image_runner_up >= DECISIVE_IMAGE_MARGIN
+    winner = fact_score if rule == "fact" else misinfo_score
+    runner_up = misinfo_score if rule == "fact" else fact_score
+    return winner >= DECISIVE_SCORE and winner - runner_up >= DECISIVE_MARGIN
+
 class MisinformationAgent:
-    def __init__(self):
-        self.db = QdrantHandler()
+    def __init__(self, init_db: bool = True, db: QdrantHandler = None, answer_policy: str = None):
+        self.answer_policy = answer_policy or ANSWER_POLICY
+        if self.answer_policy not in ANSWER_POLICIES:
+            raise ValueError(f"Unknown answer policy '{self.answer_policy}' (expected one of {ANSWER_POLICIES})")
+        self.db = db or get_qdrant_handler()
         self.embedder = EmbeddingModel()
         self.llm = LLMService()
         self.memory = MemoryManager(self.db, self.embedder)
+        # Cached answers are dropped as soon as any point they were grounded on is rewritten
+        self.db.add_upsert_listener(self.llm.invalidate_points)
+        self.db_ready = False
+        if init_db:
+            self.init_db()
+
+    def init_db(self):
         self.db.init_collections()
+        self.db_ready = True
 
-    def process_query(self, request: AgentQueryRequest) -> AgentResponse:
+    async def _search_images(self, query: str, top_k: int = 2):
+        # CLIP text encoding runs in the encoder pool so it overlaps with the text searches
+        img_vec = await self.embedder.aencode_text_for_image_search(query)
+        return await self.db.asearch(self.db.COL_IMAGES, img_vec, top_k=top_k)
+
+    async def _search_text(self, query: str, top_k: int = 2):
+        q_vec = await self.embedder.aencode_text(query)
+        return await asyncio.gather(
+            self.db.asearch(self.db.COL_FACTS, q_vec, top_k=top_k),
+            self.db.asearch(self.db.COL_MISINFO, q_vec, top_k=top_k),
+        )
+
+    async def analyze(self, request: AgentQueryRequest) -> Dict[str, Any]:
+        """
+        Retrieval + rule-based verdict (steps 1-4). Everything here is known well before the LLM
+        answers, so the streaming endpoint can emit it immediately.
+        """
         user_id = request.user_id
-        session_id = request.session_id
         query = request.query
         
-        # 1. Retrieve Context
-        past_memories = self.memory.get_context(user_id, query)
-        
-        # 2. Parallel Search (Facts vs Misinfo)
-        q_vec = self.embedder.encode_text(query)
+        # 1 + 2. Parallel Retrieval: memory context, facts, misinfo and images fan out together
+        # Join: latency is roughly the slowest single lookup instead of the sum
+        with span("agent.retrieve"):
+            past_memories, (facts, misinfo), images = await asyncio.gather(
+                self.memory.get_context(user_id, query),
+                self._search_text(query),
+                self._search_images(query),
+            )
         
-        facts = self.db.search(self.db.COL_FACTS, q_vec, top_k=2)
-        misinfo = self.db.search(self.db.COL_MISINFO, q_vec, top_k=2)
-        images = self.db.search(self.db.COL_IMAGES, self.embedder.encode_text_for_image_search(query), top_k=2)
-        
-        # 3. Analyze Veracity (Engine Logic)
+        # 3 + 4. Analyze Veracity (Engine Logic) and prepare evidence
+        with span("agent.verdict"):
+            return self._analysis(query, facts, misinfo, images)
+
+    async def analyze_batch(self, queries: List[str], top_k: int = 2) -> List[Dict[str, Any]]:
+        """
+        analyze() for many claims at once (no memory lookup): one encode call per model, one
+        query_batch_points round trip per collection and the verdict rules applied as arrays.
+        """
+        with span("agent.retrieve", queries=len(queries)):
+            text_vecs, clip_vecs = await asyncio.gather(
+                self.embedder.aencode_texts(queries),
+                self.embedder.aencode_texts_for_image_search(queries),
+            )
+            facts, misinfo, images = await asyncio.gather(
+                self.db.asearch_batch(self.db.COL_FACTS, text_vecs, top_k=top_k),
+                self.db.asearch_batch(self.db.COL_MISINFO, text_vecs, top_k=top_k),
+                self.db.asearch_batch(self.db.COL_IMAGES, clip_vecs, top_k=top_k),
+            )
+        with span("agent.verdict", queries=len(queries)):
+            rules = verdict_rules(
+                [_top_score(hits) for hits in facts],
+                [_top_score(hits) for hits in misinfo],
+                [_top_score(hits) for hits in images],
+                [has_visual_intent(q) for q in queries],
+            )
+            return [
+                self._analysis(q, f, m, i, rule=str(r))
+                for q, f, m, i, r in zip(queries, facts, misinfo, images, rules)
+            ]
+
+    def _analysis(self, query: str, facts, misinfo, images, rule: str = None) -> Dict[str, Any]:
         best_fact = facts[0] if facts else None
         best_misinfo = misinfo[0] if misinfo else None
         best_image = images[0] if images else None
         
-        fact_score = best_fact.score if best_fact else 0.0
-        misinfo_score = best_misinfo.score if best_misinfo else 0.0
-        image_score = best_image.score if best_image else 0.0
+        fact_score = _top_score(facts)
+        misinfo_score = _top_score(misinfo)
+        image_score = _top_score(images)
         
         verdict = "Insufficient Evidence"
         reasoning = "No strong evidence was found in the medical knowledge base."
         final_answer = "I could not verify this claim based on trusted medical data."
         recommendations = ["Consult a doctor for personal medical advice.", "Check WHO.org for latest guidelines."]
         
-        THRESHOLD = 0.20 # Adjusted for MiniLM cosine similarity range
-        
-        # Detect Visual Intent (Simple Heuristic or use LLM later)
-        visual_intent = any(keyword in query.lower() for keyword in ["show", "image", "picture", "diagram", "scan", "photo", "see"])
-        
-        # Priority Logic
-        # If user WANTS images and we have a good match, prioritize it.
-        if visual_intent and image_score > THRESHOLD:
+        # Priority Logic (see verdict_rules)
+        if rule is None:
+            rule = str(verdict_rules([fact_score], [misinfo_score], [image_score], [has_visual_intent(query)])[0])
+
+        if rule in ("visual", "image"):
+             # If user WANTS images and we have a good match, it takes priority
              verdict = "True"
              reasoning = f"Found verifiable medical imagery with high confidence ({image_score:.2f})."
              final_answer = f"**VISUAL CONFIRMATION**: Found relevant medical diagrams for '{best_image.payload.get('caption')}'."
              recommendations.append(f"View the attached anatomical references.")
         
-        elif fact_score > THRESHOLD and fact_score > misinfo_score:
+        elif rule == "fact":
             verdict = "True"
             reasoning = f"Matched verifiable medical fact from {best_fact.payload.get('source')} with high confidence ({fact_score:.2f})."
             final_answer = f"**CONFIRMED**: {best_fact.payload.get('body')}"
             recommendations.append(f"Learn more about {best_fact.payload.get('topic', 'health')}.")
             
-        elif misinfo_score > THRESHOLD and misinfo_score > fact_score:
+        elif rule == "misinfo":
             verdict = "False"
             reasoning = f"Matched known health misinformation (Myth: '{best_misinfo.payload.get('body')}') with high confidence ({misinfo_score:.2f})."
             final_answer = f"**DEBUNKED**: This claim is likely false. Accurate information: Medical consensus does not support this."
             recommendations.append("Be cautious of sources promoting this claim.")
             
-        elif image_score > THRESHOLD:
-            verdict = "True"
-            reasoning = f"Found verifiable medical imagery with high confidence ({image_score:.2f})."
-            final_answer = f"**VISUAL CONFIRMATION**: Found relevant medical diagrams for '{best_image.payload.get('caption')}'."
-            recommendations.append(f"View the attached anatomical references.")
-            
-        elif fact_score > 0.15 or misinfo_score > 0.15: # Lower fallback threshold
+        elif rule == "moderate":
             verdict = "Misleading" if misinfo_score > fact_score else "True"
             reasoning = "Evidence found but confidence is moderate. Context is required."
             if verdict == "True":
@@ -89,31 +203,142 @@ class MisinformationAgent:
         for f in facts:
             item = SearchResultItem(id=str(f.id), score=f.score, content=f.payload.get('body'), metadata=f.payload, type="fact", source_collection="medical_facts")
             evidence_items.append(item)
-            llm_context.append({"content": f.payload.get('body'), "score": f.score, "type": "fact", "metadata": f.payload})
+            llm_context.append({"id": str(f.id), "content": f.payload.get('body'), "score": f.score, "type": "fact", "metadata": f.payload})
             
         for m in misinfo:
             item = SearchResultItem(id=str(m.id), score=m.score, content=m.payload.get('body'), metadata=m.payload, type="misinformation", source_collection="medical_misinfo")
             evidence_items.append(item)
-            llm_context.append({"content": m.payload.get('body'), "score": m.score, "type": "misinfo", "metadata": m.payload})
+            llm_context.append({"id": str(m.id), "content": m.payload.get('body'), "score": m.score, "type": "misinfo", "metadata": m.payload})
             
         for i in images:
             item = SearchResultItem(id=str(i.id), score=i.score, content=i.payload.get('caption'), metadata=i.payload, type="image", source_collection="medical_images")
             evidence_items.append(item)
-            llm_context.append({"content": i.payload.get('caption'), "score": i.score, "type": "image", "metadata": i.payload})
+            llm_context.append({"id": str(i.id), "content": i.payload.get('caption'), "score": i.score, "type": "image", "metadata": i.payload})
 
-        # 5. Generate Grounded Response (LLM)
-        # Pass the rule-based 'final_answer' as fallback. 
-        # If LLM fails (Quota/Error), the user still gets the specific "VISUAL CONFIRMATION" or "DEBUNKED" message.
-        final_answer = self.llm.generate_grounded_response(query, llm_context, verdict, fallback_text=final_answer)
-        
+        return {
+            "verdict": verdict,
+            "reasoning": reasoning,
+            "rule": rule,
+            "decisive": is_decisive(rule, fact_score, misinfo_score, image_score, images[1].score if len(images) > 1 else 0.0),
+            "fallback_answer": final_answer,
+            "recommendations": recommendations,
+            "evidence": evidence_items,
+            "llm_context": llm_context,
+        }
+
+    async def _remember(self, request: AgentQueryRequest, verdict: str) -> List[str]:
         # 6. Update Memory
-        self.memory.add_memory(user_id, session_id, f"Query: {query} | Verdict: {verdict}", memory_type="history")
+        with span("agent.remember"):
+            await self.memory.add_memory(request.user_id, request.session_id, f"Query: {request.query} | Verdict: {verdict}", memory_type="history")
+        return ["stored_interaction"]
+
+    def _fast_path(self, query: str, analysis: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        """(answer, tier) when the answer policy says not to wait for the LLM, otherwise None."""
+        if self.answer_policy == "llm" or (self.answer_policy == "tiered" and not analysis["decisive"]):
+            return None
+        cached = self.llm.cached_response(query, analysis["llm_context"], analysis["verdict"])
+        if cached is not None:
+            return cached, "cached"
+        if self.answer_policy == "tiered" and ANSWER_BACKGROUND_FILL and analysis["rule"] != "none":
+            self.llm.prefetch(query, analysis["llm_context"], analysis["verdict"])
+        return analysis["fallback_answer"], "template"
+
+    async def _answer(self, query: str, analysis: Dict[str, Any]) -> Tuple[str, str]:
+        # 5. Generate Grounded Response (LLM), unless the verdict is decisive (tier "template")
+        with span("agent.answer", policy=self.answer_policy):
+            fast = self._fast_path(query, analysis)
+            if fast is not None:
+                return fast
+            # Pass the rule-based 'final_answer' as fallback. 
+            # If LLM fails (Quota/Error), the user still gets the specific "VISUAL CONFIRMATION" or "DEBUNKED" message.
+            return await self.llm.grounded_answer(
+                query, analysis["llm_context"], analysis["verdict"], fallback_text=analysis["fallback_answer"]
+            )
+
+    async def process_query(self, request: AgentQueryRequest) -> AgentResponse:
+        analysis = await self.analyze(request)
+
+        final_answer, answer_tier = await self._answer(request.query, analysis)
+        
+        memory_actions = await self._remember(request, analysis["verdict"])
         
         return AgentResponse(
             final_answer=final_answer,
-            verdict=verdict,
-            reasoning_trace=reasoning,
-            evidence=evidence_items,
-            recommendations=recommendations,
-            memory_actions=["stored_interaction"]
+            verdict=analysis["verdict"],
+            reasoning_trace=analysis["reasoning"],
+            evidence=analysis["evidence"],
+            recommendations=analysis["recommendations"],
+            memory_actions=memory_actions,
+            answer_tier=answer_tier
         )
+
+    async def process_batch(self, request: BatchAgentQueryRequest) -> BatchAgentResponse:
+        """
+        Bulk fact-checking. Verdicts come from analyze_batch; the LLM answer and the memory write
+        are opt-in (include_llm / include_memory), otherwise final_answer is the rule-based answer.
+        With include_llm the answer policy applies per claim, as in process_query.
+        """
+        analyses = await self.analyze_batch(request.queries)
+
+        if request.include_llm:
+            limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+            async def answer(query, analysis):
+                async with limit:
+                    return await self._answer(query, analysis)
+            answers = await asyncio.gather(*(answer(q, a) for q, a in zip(request.queries, analyses)))
+        else:
+            answers = [(a["fallback_answer"], "template") for a in analyses]
+
+        if request.include_memory:
+            memory_actions = await asyncio.gather(*(
+                self._remember(AgentQueryRequest(query=q, user_id=request.user_id, session_id=request.session_id), a["verdict"])
+                for q, a in zip(request.queries, analyses)
+            ))
+        else:
+            memory_actions = [[] for _ in analyses]
+
+        return BatchAgentResponse(results=[
+            AgentResponse(
+                final_answer=final_answer,
+                verdict=a["verdict"],
+                reasoning_trace=a["reasoning"],
+                evidence=a["evidence"],
+                recommendations=a["recommendations"],
+                memory_actions=actions,
+                answer_tier=answer_tier
+            )
+            for a, (final_answer, answer_tier), actions in zip(analyses, answers, memory_actions)
+        ])
+
+    async def stream_query(self, request: AgentQueryRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of process_query. Yields (event, data) pairs:
+        "verdict" (verdict, reasoning, evidence, recommendations) as soon as retrieval is scored,
+        then "token" chunks of the LLM answer, then "done" with the full answer and its tier.
+        """
+        analysis = await self.analyze(request)
+        yield "verdict", {
+            "verdict": analysis["verdict"],
+            "reasoning_trace": analysis["reasoning"],
+            "evidence": [item.dict() for item in analysis["evidence"]],
+            "recommendations": analysis["recommendations"],
+        }
+
+        chunks = []
+        fast = self._fast_path(request.query, analysis)
+        if fast is not None:
+            answer, answer_tier = fast
+            chunks.append(answer)
+            yield "token", {"text": answer}
+        else:
+            meta = {}
+            async for chunk in self.llm.stream_grounded_response(
+                request.query, analysis["llm_context"], analysis["verdict"], fallback_text=analysis["fallback_answer"], meta=meta
+            ):
+                chunks.append(chunk)
+                yield "token", {"text": chunk}
+            answer_tier = meta["tier"]
+
+        memory_actions = await self._remember(request, analysis["verdict"])
+        yield "done", {"final_answer": "".join(chunks), "memory_actions": memory_actions, "answer_tier": answer_tier}
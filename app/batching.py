@@ -0,0 +1,109 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+from app.metrics import background_context, observe_stage
+
+
+class MicroBatcher:
+    """
+    Collects concurrent encode requests for up to `max_wait_ms` or `max_batch_size`
+    items, runs ONE batched forward pass in the executor and hands every caller
+    back its own result.
+    """
+
+    def __init__(self, encode_batch: Callable[[List[Any]], List[Any]], executor, max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, name: str = "batcher"):
+        self.encode_batch = encode_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+        self.batch_size_histogram: Dict[int, int] = {}
+        self.total_encode_seconds = 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        # (Re)start the worker if this is the first call or we're on a new event loop
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run(), name=f"{self.name}-worker", context=background_context())
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            inputs = [item for item, _ in batch]
+            start = time.perf_counter()
+            try:
+                results = await self._loop.run_in_executor(self.executor, self.encode_batch, inputs)
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self._record(len(batch), time.perf_counter() - start)
+
+    def _record(self, size: int, seconds: float):
+        self.batches += 1
+        self.items += size
+        self.max_seen_batch = max(self.max_seen_batch, size)
+        self.batch_size_histogram[size] = self.batch_size_histogram.get(size, 0) + 1
+        self.total_encode_seconds += seconds
+        observe_stage(f"embed.batch.{self.name}", seconds)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def metric_samples(self):
+        labels = {"batcher": self.name}
+        return [
+            ("healthguard_batcher_queue_depth", "gauge", "Encode requests waiting for a micro-batch.", [(labels, self.queue_depth)]),
+            ("healthguard_batcher_batches_total", "counter", "Micro-batches encoded.", [(labels, self.batches)]),
+            ("healthguard_batcher_items_total", "counter", "Items encoded through micro-batches.", [(labels, self.items)]),
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_seen_batch,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+            "avg_batch_ms": round(1000 * self.total_encode_seconds / self.batches, 2) if self.batches else 0.0,
+        }
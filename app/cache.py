@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+def normalize_text(text: str) -> str:
+    # Both MiniLM and CLIP tokenizers are uncased, so casing/whitespace never changes the vector
+    return " ".join(text.lower().split())
+
+
+class TTLLRUCache:
+    """
+    Bounded in-memory LRU cache with optional TTL and an optional on-disk (SQLite) tier.
+    Values must be JSON-serialisable when the disk tier is enabled.
+    `on_evict(key)` is called (outside the cache lock) for every key dropped by LRU eviction or TTL expiry.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: Optional[float] = None, disk_path: Optional[str] = None,
+                 on_evict: Optional[Callable[[Hashable], None]] = None):
+        self.max_size = max_size
+        self.ttl = ttl_seconds or None
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self.disk_path = disk_path
+        self._disk_conn = None
+        self._disk_pid = None
+        if disk_path:
+            self._disk.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)")
+            self._disk.commit()
+
+    @property
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        # One connection per process: a SQLite handle must not cross a fork (gunicorn --preload workers)
+        if not self.disk_path:
+            return None
+        if self._disk_pid != os.getpid():
+            self._disk_conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._disk_pid = os.getpid()
+        return self._disk_conn
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and (time.time() - stored_at) > self.ttl
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        evicted = []
+        try:
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None:
+                    value, stored_at = entry
+                    if not self._expired(stored_at):
+                        self._data.move_to_end(key)
+                        self.hits += 1
+                        return value
+                    del self._data[key]
+                    evicted.append(key)
+
+                value = self._disk_get(key)
+                if value is not None:
+                    self.disk_hits += 1
+                    evicted += self._put(key, value, time.time(), write_disk=False)
+                    if key in evicted:
+                        evicted.remove(key)
+                    return value
+
+                self.misses += 1
+                return None
+        finally:
+            self._notify_evicted(evicted)
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            evicted = self._put(key, value, time.time(), write_disk=True)
+        self._notify_evicted(evicted)
+
+    def _notify_evicted(self, keys: List[Hashable]):
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+    def _put(self, key: Hashable, value: Any, stored_at: float, write_disk: bool) -> List[Hashable]:
+        self._data[key] = (value, stored_at)
+        self._data.move_to_end(key)
+        evicted = []
+        while len(self._data) > self.max_size:
+            evicted.append(self._data.popitem(last=False)[0])
+            self.evictions += 1
+        if write_disk and self._disk is not None:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (json.dumps(key), json.dumps(value), stored_at)
+            )
+            self._disk.commit()
+        return evicted
+
+    def _disk_get(self, key: Hashable) -> Optional[Any]:
+        if self._disk is None:
+            return None
+        row = self._disk.execute("SELECT value, stored_at FROM cache WHERE key = ?", (json.dumps(key),)).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return json.loads(row[0])
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM cache WHERE key = ?", (json.dumps(key),))
+                self._disk.commit()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM cache")
+                self._disk.commit()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,102 @@
+import json
+import os
+from pydantic import BaseModel
+from qdrant_client.http import models
+from typing import Dict, Literal, Optional
+
+
+class CollectionConfig(BaseModel):
+    """Storage, index and search-time settings for one collection (Qdrant backends only)."""
+    # Vector quantization: int8 scalar (4x smaller) or 1-bit binary (32x), rescored with the originals
+    quantization: Optional[Literal["scalar", "binary"]] = None
+    quantization_always_ram: bool = True
+    rescore: bool = True
+    oversampling: Optional[float] = None
+    # Keep original vectors / payloads on disk instead of RAM
+    on_disk: bool = False
+    on_disk_payload: bool = False
+    # HNSW build settings. hnsw_m=0 + hnsw_payload_m builds one graph per tenant (payload index
+    # with is_tenant) instead of a global one: right for collections that are only ever searched
+    # filtered by that tenant field
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    hnsw_payload_m: Optional[int] = None
+    # Search-time settings
+    hnsw_ef: Optional[int] = None
+    exact: bool = False
+
+    def vectors_config(self, size: int) -> models.VectorParams:
+        return models.VectorParams(size=size, distance=models.Distance.COSINE, on_disk=self.on_disk or None)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=self.quantization_always_ram
+            ))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(
+                always_ram=self.quantization_always_ram
+            ))
+        return None
+
+    def hnsw_config(self) -> Optional[models.HnswConfigDiff]:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None and self.hnsw_payload_m is None:
+            return None
+        return models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct, payload_m=self.hnsw_payload_m)
+
+    def search_params(self) -> Optional[models.SearchParams]:
+        if self.hnsw_ef is None and not self.exact and self.quantization is None:
+            return None
+        quantization = None
+        if self.quantization is not None:
+            quantization = models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, exact=self.exact, quantization=quantization)
+
+
+# Defaults: every collection plain fp32 in RAM with Qdrant's HNSW defaults, as before these settings
+# existed. Everything else is opt-in through HEALTHGUARD_COLLECTION_CONFIG, e.g. for large deployments
+#   {"medical_facts": {"quantization": "scalar", "on_disk": true, "oversampling": 2.0},
+#    "user_memory": {"hnsw_m": 0, "hnsw_payload_m": 16}}
+# (int8 vectors in RAM with fp32 originals on disk for the feed-fed facts; per-user HNSW for memory,
+# which is only ever searched filtered by user_id).
+DEFAULT_COLLECTION_CONFIGS: Dict[str, Dict] = {}
+
+# Payload indexes per collection: field -> "keyword", "datetime" or "tenant" (keyword with is_tenant,
+# which co-locates each tenant's points on disk). Filtered searches on unindexed fields fall back to
+# scanning, which gets slow as collections grow.
+_CONTENT_INDEXES = {"topic": "keyword", "source": "keyword", "date": "datetime", "ingest_source": "keyword"}
+PAYLOAD_INDEXES: Dict[str, Dict[str, str]] = {
+    "medical_facts": _CONTENT_INDEXES,
+    "medical_misinfo": _CONTENT_INDEXES,
+    "medical_images": _CONTENT_INDEXES,
+    "user_memory": {"user_id": "tenant"},
+}
+
+def payload_schema(kind: str):
+    if kind == "tenant":
+        return models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+    if kind == "datetime":
+        return models.PayloadSchemaType.DATETIME
+    if kind == "keyword":
+        return models.PayloadSchemaType.KEYWORD
+    raise ValueError(f"Unknown payload index type '{kind}'")
+
+def load_collection_configs() -> Dict[str, CollectionConfig]:
+    """
+    Defaults merged with HEALTHGUARD_COLLECTION_CONFIG: inline JSON or a path to a JSON file,
+    e.g. '{"user_memory": {"on_disk_payload": true, "hnsw_m": 8}}'.
+    """
+    raw = os.getenv("HEALTHGUARD_COLLECTION_CONFIG", "")
+    overrides = {}
+    if raw:
+        if os.path.exists(raw):
+            with open(raw) as f:
+                overrides = json.load(f)
+        else:
+            overrides = json.loads(raw)
+
+    names = set(DEFAULT_COLLECTION_CONFIGS) | set(overrides)
+    return {
+        name: CollectionConfig(**{**DEFAULT_COLLECTION_CONFIGS.get(name, {}), **overrides.get(name, {})})
+        for name in names
+    }
@@ -1,21 +1,261 @@
-from sentence_transformers import SentenceTransformer
 from PIL import Image
-import torch
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from app.batching import MicroBatcher
+from app.cache import TTLLRUCache, normalize_text
+from app.image_pipeline import load_for_clip
+from app.metrics import REGISTRY, cache_families, span
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# Threads used to run CPU-bound encoding off the event loop (torch releases the GIL)
+ENCODE_WORKERS = int(os.getenv("HEALTHGUARD_ENCODE_WORKERS", "2"))
+# Micro-batching: flush a batch after this many items or this many milliseconds
+BATCH_MAX_SIZE = int(os.getenv("HEALTHGUARD_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("HEALTHGUARD_BATCH_MAX_WAIT_MS", "5"))
+# Query-embedding cache: LRU size, optional TTL (0 = never expire) and optional SQLite file
+EMBED_CACHE_SIZE = int(os.getenv("HEALTHGUARD_EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_TTL = float(os.getenv("HEALTHGUARD_EMBED_CACHE_TTL", "0"))
+EMBED_CACHE_PATH = os.getenv("HEALTHGUARD_EMBED_CACHE_PATH")
+# Forward-pass size for bulk encoding (batch endpoints, ingestion); bounds activation memory
+BULK_BATCH_SIZE = int(os.getenv("HEALTHGUARD_BULK_BATCH_SIZE", "64"))
+
+# CPU inference backend: "torch" (fp32), "int8" (dynamic int8 quantization of Linear layers)
+# or "onnx" (ONNX Runtime via sentence-transformers; CLIP falls back to int8 for its text tower)
+EMBED_BACKEND = os.getenv("HEALTHGUARD_EMBED_BACKEND", "torch")
+EMBED_BACKENDS = ("torch", "int8", "onnx")
+# Explicit torch intra-op threads (0 = torch default, i.e. one per core)
+TORCH_THREADS = int(os.getenv("HEALTHGUARD_TORCH_THREADS", "0"))
+
+TEXT_MODEL_NAME = 'all-MiniLM-L6-v2'
+CLIP_MODEL_NAME = 'clip-ViT-B-32'
+MODEL_ALIASES = {"text": TEXT_MODEL_NAME, "clip": CLIP_MODEL_NAME}
+
+def configure_torch_threads(threads: int):
+    import torch
+    if threads > 0 and torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+        print(f"[Embeddings] torch intra-op threads = {threads}")
+
+def torch_thread_settings():
+    """Thread-pool configuration as torch sees it (torch is not imported just to answer this)."""
+    settings = {
+        "configured_threads": TORCH_THREADS,
+        "encode_workers": ENCODE_WORKERS,
+        "cpu_count": os.cpu_count(),
+        "affinity": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None,
+        "env": {k: os.getenv(k) for k in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "TOKENIZERS_PARALLELISM")},
+        "torch_loaded": "torch" in sys.modules,
+    }
+    if settings["torch_loaded"]:
+        import torch
+        settings["intra_op_threads"] = torch.get_num_threads()
+        settings["inter_op_threads"] = torch.get_num_interop_threads()
+        settings["parallel_info"] = torch.__config__.parallel_info()
+    return settings
+
+def quantize_int8(module):
+    """
+    Dynamic int8 quantization of every nn.Linear in `module` (CPU only). Submodules are swapped in
+    place, but if `module` is itself a Linear only the returned module is quantized: use the result.
+    """
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
 
 class EmbeddingModel:
-    def __init__(self):
-        # Load text model
-        self.text_model = SentenceTransformer('all-MiniLM-L6-v2')
-        # Load clip model for images (using sentence-transformers wrapper for convenience)
-        self.clip_model = SentenceTransformer('clip-ViT-B-32')
+    def __init__(self, backend: str = None, threads: int = None):
+        self.backend = backend or EMBED_BACKEND
+        if self.backend not in EMBED_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{self.backend}' (expected one of {EMBED_BACKENDS})")
+        self.threads = TORCH_THREADS if threads is None else threads
+        # Models are loaded lazily on first use (or by warm_up), so constructing this is cheap
+        # and text-only callers never pay for CLIP (or even for importing torch).
+        self._models: Dict[str, object] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._load_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+
+        # One batcher per model: concurrent requests share a single forward pass
+        self.text_batcher = MicroBatcher(self.encode_texts, self.executor, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="minilm")
+        self.clip_text_batcher = MicroBatcher(self.encode_texts_for_image_search, self.executor, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="clip_text")
+        # Shared by the agent, /search and /memory: repeated queries skip the encoder entirely
+        self.cache = TTLLRUCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL, EMBED_CACHE_PATH)
+        # Cache misses being encoded right now, by cache key
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        REGISTRY.register_collector(self.metric_samples)
+
+    def _get_model(self, name: str):
+        model = self._models.get(name)
+        if model is None:
+            with self._load_lock:
+                model = self._models.get(name)
+                if model is None:
+                    start = time.perf_counter()
+                    model = self._load(name)
+                    self._load_seconds[name] = round(time.perf_counter() - start, 2)
+                    self._models[name] = model
+                    print(f"[Embeddings] Loaded {name} ({self.backend}) in {self._load_seconds[name]}s")
+        return model
+
+    def _load(self, name: str):
+        from sentence_transformers import SentenceTransformer
+        configure_torch_threads(self.threads)
+
+        if self.backend == "onnx" and name != CLIP_MODEL_NAME:
+            return SentenceTransformer(name, backend="onnx")
+
+        model = SentenceTransformer(name)
+        if self.backend in ("int8", "onnx"):
+            if name == CLIP_MODEL_NAME:
+                # Only the text tower is quantized: query encoding gets faster while image
+                # vectors (already stored in Qdrant) keep their fp32 quality
+                clip = model[0].model
+                # quantize_dynamic can't swap a root module in place: text_projection is itself a
+                # Linear, so its quantized replacement has to be assigned back
+                clip.text_model = quantize_int8(clip.text_model)
+                clip.text_projection = quantize_int8(clip.text_projection)
+            else:
+                model = quantize_int8(model)
+        return model
+
+    def model_version(self, name: str) -> str:
+        # Vectors from different backends drift slightly, so caches/hashes key on both
+        return name if self.backend == "torch" else f"{name}:{self.backend}"
+
+    @property
+    def text_model(self):
+        return self._get_model(TEXT_MODEL_NAME)
+
+    @property
+    def clip_model(self):
+        # CLIP model for images (using sentence-transformers wrapper for convenience)
+        return self._get_model(CLIP_MODEL_NAME)
+
+    def loaded_models(self) -> Dict[str, bool]:
+        return {name: name in self._models for name in (TEXT_MODEL_NAME, CLIP_MODEL_NAME)}
+
+    def loaded_models_for(self, models: List[str]) -> bool:
+        # True once every named model ("text", "clip" or a full model name) is in memory
+        return all(MODEL_ALIASES.get(m, m) in self._models for m in models)
+
+    def load_times(self) -> Dict[str, float]:
+        return dict(self._load_seconds)
+
+    def warm_up(self, models: List[str] = None, background: bool = True):
+        """
+        Pre-loads the given models ("text", "clip"; default both).
+        With background=True this returns immediately and loads in a daemon thread.
+        """
+        targets = [MODEL_ALIASES.get(m, m) for m in (models or ["text", "clip"])]
+
+        def _load():
+            for name in targets:
+                self._get_model(name)
+
+        if background:
+            thread = threading.Thread(target=_load, name="embeddings-warmup", daemon=True)
+            thread.start()
+            return thread
+        _load()
+        return None
 
     def encode_text(self, text: str):
         return self.text_model.encode(text).tolist()
 
+    def encode_texts(self, texts: List[str]) -> List[List[float]]:
+        return self.text_model.encode(texts, batch_size=min(len(texts), BULK_BATCH_SIZE) or 1).tolist()
+
     def encode_image(self, image_path: str):
-        img = Image.open(image_path)
+        img = load_for_clip(image_path)
         return self.clip_model.encode(img).tolist()
 
+    def encode_pil_images(self, images: List[Image.Image]) -> List[List[float]]:
+        # One CLIP forward pass for a whole batch of already-decoded images
+        return self.clip_model.encode(images, batch_size=len(images) or 1).tolist()
+
     def encode_text_for_image_search(self, text: str):
         # CLIP-based text embedding to search in image space
         return self.clip_model.encode(text).tolist()
+
+    def encode_texts_for_image_search(self, texts: List[str]) -> List[List[float]]:
+        return self.clip_model.encode(texts, batch_size=min(len(texts), BULK_BATCH_SIZE) or 1).tolist()
+
+    def batch_stats(self):
+        return {
+            "text": self.text_batcher.stats(),
+            "clip_text": self.clip_text_batcher.stats(),
+        }
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def metric_samples(self):
+        return (cache_families("embeddings", self.cache.stats())
+                + self.text_batcher.metric_samples() + self.clip_text_batcher.metric_samples())
+
+    # --- Async variants (used by the API so encoding never blocks the event loop) ---
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def _cached(self, model_name: str, batcher: MicroBatcher, text: str, use_cache: bool):
+        if not use_cache:
+            return await batcher.submit(text)
+        key = (model_name, normalize_text(text))
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector
+        # Single-flight: concurrent misses on the same text (e.g. memory lookup + fact search of
+        # one query) share one encode instead of each adding a copy to the micro-batch
+        future = self._inflight.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(self._encode_and_cache(key, batcher, text))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
+        # Shielded: one caller being cancelled must not cancel the encode the others wait on
+        return await asyncio.shield(future)
+
+    async def _encode_and_cache(self, key, batcher: MicroBatcher, text: str):
+        vector = await batcher.submit(text)
+        self.cache.set(key, vector)
+        return vector
+
+    async def _cached_many(self, model_name: str, encode_batch, texts: List[str], use_cache: bool):
+        # Bulk path: cache hits are skipped, the (deduplicated) misses go through one encode call
+        # directly instead of being split into micro-batches
+        keys = [(model_name, normalize_text(t)) for t in texts]
+        vectors = {k: self.cache.get(k) for k in keys} if use_cache else {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if vectors.get(key) is None:
+                missing.setdefault(key, text)
+        if missing:
+            encoded = await self._run(encode_batch, list(missing.values()))
+            for key, vector in zip(missing, encoded):
+                vectors[key] = vector
+                if use_cache:
+                    self.cache.set(key, vector)
+        return [vectors[k] for k in keys]
+
+    async def aencode_texts(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        with span("embed.minilm.bulk", count=len(texts)):
+            return await self._cached_many(self.model_version(TEXT_MODEL_NAME), self.encode_texts, texts, use_cache)
+
+    async def aencode_texts_for_image_search(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        with span("embed.clip_text.bulk", count=len(texts)):
+            return await self._cached_many(self.model_version(CLIP_MODEL_NAME), self.encode_texts_for_image_search, texts, use_cache)
+
+    async def aencode_text(self, text: str, use_cache: bool = True):
+        with span("embed.minilm"):
+            return await self._cached(self.model_version(TEXT_MODEL_NAME), self.text_batcher, text, use_cache)
+
+    async def aencode_image(self, image_path: str):
+        with span("embed.clip_image"):
+            return await self._run(self.encode_image, image_path)
+
+    async def aencode_text_for_image_search(self, text: str, use_cache: bool = True):
+        with span("embed.clip_text"):
+            return await self._cached(self.model_version(CLIP_MODEL_NAME), self.clip_text_batcher, text, use_cache)
@@ -0,0 +1,72 @@
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+from PIL import Image
+
+# CLIP ViT-B/32 works on 224x224 crops: anything larger is decoded and then thrown away
+CLIP_RESOLUTION = 224
+IMAGE_BATCH_SIZE = int(os.getenv("HEALTHGUARD_IMAGE_BATCH_SIZE", "32"))
+# Batches decoded ahead of the one being encoded (decode overlaps inference)
+PREFETCH_BATCHES = 2
+
+def load_for_clip(path: str, size: int = CLIP_RESOLUTION) -> Image.Image:
+    """
+    Decodes an image already downsized so its shortest side is `size` (what CLIP's
+    preprocessing resizes to anyway). JPEGs are decoded at reduced scale via draft().
+    """
+    img = Image.open(path)
+    w, h = img.size
+    scale = size / min(w, h)
+    if scale < 1:
+        target = (max(size, math.ceil(w * scale)), max(size, math.ceil(h * scale)))
+        img.draft("RGB", target)  # no-op for non-JPEG formats
+        img = img.convert("RGB")
+        img.thumbnail(target, Image.BICUBIC, reducing_gap=2.0)
+    else:
+        img = img.convert("RGB")
+    return img
+
+def _safe_load(path: str) -> Tuple[str, Optional[Image.Image], Optional[str]]:
+    try:
+        return path, load_for_clip(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+def encode_image_files(embedder, paths: List[str], batch_size: int = IMAGE_BATCH_SIZE, workers: Optional[int] = None,
+                       use_processes: bool = True) -> Iterator[Tuple[str, Optional[List[float]]]]:
+    """
+    Yields (path, vector) for every path, in order (vector is None if the image failed to load).
+    Decoding/resizing runs in a process pool (or thread pool), CLIP sees fixed-size batches, and
+    the next batches are decoded while the current one is being encoded.
+    """
+    if not paths:
+        return
+    pool_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool_cls(max_workers=workers) as pool:
+        batches = (paths[i:i + batch_size] for i in range(0, len(paths), batch_size))
+        pending = deque()
+
+        def submit_next():
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append([pool.submit(_safe_load, p) for p in batch])
+
+        for _ in range(1 + PREFETCH_BATCHES):
+            submit_next()
+
+        while pending:
+            decoded = [f.result() for f in pending.popleft()]
+            submit_next()  # keep the decoders busy while CLIP runs
+            yield from _encode_batch(embedder, decoded)
+
+def _encode_batch(embedder, decoded) -> Iterator[Tuple[str, Optional[List[float]]]]:
+    images = [img for _, img, _ in decoded if img is not None]
+    vectors = iter(embedder.encode_pil_images(images)) if images else iter(())
+    for path, img, error in decoded:
+        if img is None:
+            print(f"Failed to process image {path}: {error}")
+            yield path, None
+        else:
+            yield path, next(vectors)
@@ -1,30 +1,356 @@
 
+import asyncio
 import openai
 import os
 import json
-from typing import List, Dict, Optional
+import threading
+import time
+from typing import AsyncIterator, List, Dict, Optional, Set, Tuple
 from dotenv import load_dotenv
+from app.cache import TTLLRUCache, normalize_text
+from app.metrics import REGISTRY, background_context, cache_families, observe_stage, span
 
 load_dotenv() # Load immediately
 
+# Grounded-answer cache: entries expire after TTL seconds and are dropped when any evidence point is upserted
+ANSWER_CACHE_SIZE = int(os.getenv("HEALTHGUARD_ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("HEALTHGUARD_ANSWER_CACHE_TTL", "3600"))
+# Evidence scores are bucketed so tiny float noise doesn't defeat the cache
+SCORE_BUCKET = float(os.getenv("HEALTHGUARD_ANSWER_SCORE_BUCKET", "0.05"))
+# Background answer fills (see prefetch): at most this many queued, extra requests are dropped, and
+# at most PREFETCH_MAX_CONCURRENCY calling the LLM at once (on their own slots, not the request path's)
+PREFETCH_MAX_PENDING = int(os.getenv("HEALTHGUARD_PREFETCH_MAX_PENDING", "16"))
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("HEALTHGUARD_PREFETCH_MAX_CONCURRENCY", "2"))
+
+# Endpoint/model: OPENAI_BASE_URL points the client at any OpenAI-compatible server
+# (e.g. scripts/mock_llm_server.py for testing)
+LLM_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_MODEL = os.getenv("HEALTHGUARD_LLM_MODEL", "gpt-4o-mini")
+# Latency budget: hard deadline per completion (including the wait for a slot), and for streams the
+# deadline for the first token and for the whole answer. Past it the rule-based answer is used.
+LLM_TIMEOUT = float(os.getenv("HEALTHGUARD_LLM_TIMEOUT", "8"))
+LLM_STREAM_TIMEOUT = float(os.getenv("HEALTHGUARD_LLM_STREAM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("HEALTHGUARD_LLM_MAX_RETRIES", "1"))
+# Completions in flight at once (per process)
+LLM_MAX_CONCURRENCY = int(os.getenv("HEALTHGUARD_LLM_MAX_CONCURRENCY", "16"))
+# Circuit breaker: open after this many consecutive failures/timeouts, retry after RESET seconds
+LLM_CIRCUIT_FAILURES = int(os.getenv("HEALTHGUARD_LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_RESET = float(os.getenv("HEALTHGUARD_LLM_CIRCUIT_RESET", "30"))
+
+class LLMUnavailable(Exception):
+    """The LLM was skipped or gave up (deadline, open circuit, no free slot)."""
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures. While open, calls are refused
+    until `reset_seconds` have passed; then a single trial call is let through (half-open), which
+    closes the circuit on success or re-opens it on failure.
+    """
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+
+    def available(self) -> bool:
+        # Side-effect free check (used before queueing for a slot)
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_seconds
+        return False # half-open: the trial call is still running
+
+    def acquire(self) -> bool:
+        if not self.available():
+            return False
+        if self.state == "open":
+            self.state = "half_open"
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                print(f"⚠️ LLM circuit opened after {self.failures} failures (retry in {self.reset_seconds}s)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def abandon(self):
+        # The trial call was cancelled (e.g. client went away): let the next request try instead
+        if self.state == "half_open":
+            self.state = "open"
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
 class LLMService:
     def __init__(self):
         # Allow API key from env or use a placeholder for now if not set
         self.api_key = os.getenv("OPENAI_API_KEY") 
         if self.api_key:
-            self.client = openai.OpenAI(api_key=self.api_key)
+            # Async client so a slow completion never stalls other requests on the worker
+            # The SDK timeout backs up the deadline enforced in _complete/_stream
+            self.client = openai.AsyncOpenAI(
+                api_key=self.api_key, base_url=LLM_BASE_URL, timeout=LLM_STREAM_TIMEOUT, max_retries=LLM_MAX_RETRIES
+            )
         else:
             print("⚠️ STARTUP WARNING: OPENAI_API_KEY not set. LLM will use mock responses.")
             self.client = None
 
-    def generate_grounded_response(self, user_query: str, evidence: List[Dict], verdict: str, fallback_text: str = "") -> str:
+        self.cache = TTLLRUCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, on_evict=self._unindex)
+        # point_id -> cache keys grounded on it (for invalidation on upsert), and the reverse so
+        # entries leaving the cache (LRU eviction, TTL expiry) are dropped from the index too
+        self._keys_by_point: Dict[str, Set[Tuple]] = {}
+        self._points_by_key: Dict[Tuple, Set[str]] = {}
+        self._index_lock = threading.Lock()
+        # Background fills in flight, by cache key
+        self._prefetching: Dict[Tuple, asyncio.Task] = {}
+        self._prefetch_slots = asyncio.Semaphore(PREFETCH_MAX_CONCURRENCY)
+        # dropped: queue full; skipped: circuit not closed when its turn came
+        self.prefetch_stats = {"scheduled": 0, "dropped": 0, "completed": 0, "failed": 0, "skipped": 0}
+
+        self.breaker = CircuitBreaker(LLM_CIRCUIT_FAILURES, LLM_CIRCUIT_RESET)
+        self._slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self._in_flight = 0
+        # ok / timeout / error / circuit_open / saturated (no slot before the deadline)
+        self.outcomes = {"ok": 0, "timeout": 0, "error": 0, "circuit_open": 0, "saturated": 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        REGISTRY.register_collector(self.metric_samples)
+
+    @staticmethod
+    def cache_key(user_query: str, evidence: List[Dict], verdict: str) -> Tuple:
+        evidence_key = tuple(sorted(
+            (str(item.get("id", item.get("content"))), round(item["score"] / SCORE_BUCKET)) for item in evidence
+        ))
+        return (normalize_text(user_query), verdict, evidence_key)
+
+    def _cache_answer(self, key: Tuple, evidence: List[Dict], answer: str):
+        # Indexed before it's cached: an immediate eviction then finds (and drops) the index entry
+        point_ids = {str(item["id"]) for item in evidence if "id" in item}
+        with self._index_lock:
+            self._points_by_key.setdefault(key, set()).update(point_ids)
+            for point_id in point_ids:
+                self._keys_by_point.setdefault(point_id, set()).add(key)
+        self.cache.set(key, answer)
+
+    def _unindex(self, key: Tuple):
+        with self._index_lock:
+            for point_id in self._points_by_key.pop(key, ()):
+                keys = self._keys_by_point.get(point_id)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._keys_by_point[point_id]
+
+    def invalidate_points(self, collection_name: str, point_ids: List[str]):
+        """Upsert listener: drops every cached answer grounded on one of `point_ids`."""
+        with self._index_lock:
+            keys = set()
+            for point_id in point_ids:
+                keys |= self._keys_by_point.pop(str(point_id), set())
+        for key in keys:
+            self._unindex(key)
+            self.cache.invalidate(key)
+
+    def cache_stats(self):
+        stats = self.cache.stats()
+        stats["prefetch"] = {"pending": len(self._prefetching), **self.prefetch_stats}
+        return stats
+
+    def llm_stats(self):
+        ok = self.outcomes["ok"]
+        return {
+            "outcomes": dict(self.outcomes),
+            "in_flight": self._in_flight,
+            "max_concurrency": LLM_MAX_CONCURRENCY,
+            "timeout_seconds": LLM_TIMEOUT,
+            "avg_ms": round(1000 * self._latency_total / ok, 1) if ok else 0.0,
+            "max_ms": round(1000 * self._latency_max, 1),
+            "circuit": self.breaker.stats(),
+        }
+
+    def metric_samples(self):
+        circuit = {"closed": 0, "half_open": 1, "open": 2}[self.breaker.state]
+        return cache_families("answers", self.cache.stats()) + [
+            ("healthguard_llm_calls_total", "counter", "LLM calls by outcome.",
+             [({"outcome": outcome}, count) for outcome, count in self.outcomes.items()]),
+            ("healthguard_llm_in_flight", "gauge", "LLM completions currently running.", [({}, self._in_flight)]),
+            ("healthguard_llm_circuit_state", "gauge", "LLM circuit breaker: 0 closed, 1 half-open, 2 open.", [({}, circuit)]),
+            ("healthguard_llm_prefetch_pending", "gauge", "Background answer fills in flight.", [({}, len(self._prefetching))]),
+        ]
+
+    def _record(self, outcome: str, started: float = None):
+        self.outcomes[outcome] += 1
+        if outcome == "ok":
+            elapsed = time.perf_counter() - started
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+        if outcome == "ok":
+            self.breaker.record_success()
+        elif outcome in ("timeout", "error"):
+            self.breaker.record_failure()
+
+    async def _acquire_slot(self, deadline: float):
+        """Circuit check + a concurrency slot before `deadline` (loop time); raises LLMUnavailable."""
+        if not self.breaker.available():
+            self._record("circuit_open")
+            raise LLMUnavailable("circuit open")
+        try:
+            async with asyncio.timeout_at(deadline):
+                await self._slots.acquire()
+        except TimeoutError:
+            self._record("saturated")
+            raise LLMUnavailable(f"no free LLM slot within {LLM_TIMEOUT}s")
+        # Re-checked after queueing: the circuit may have opened meanwhile
+        if not self.breaker.acquire():
+            self._slots.release()
+            self._record("circuit_open")
+            raise LLMUnavailable("circuit open")
+        self._in_flight += 1
+
+    def _release_slot(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        """One completion under the deadline, concurrency limit and circuit breaker."""
+        with span("llm.complete", model=LLM_MODEL):
+            return await self._complete_once(messages)
+
+    async def _complete_once(self, messages: List[Dict[str, str]]) -> str:
+        started = time.perf_counter()
+        deadline = asyncio.get_running_loop().time() + LLM_TIMEOUT
+        await self._acquire_slot(deadline)
+        try:
+            async with asyncio.timeout_at(deadline):
+                answer = await self._request(messages)
+        except TimeoutError:
+            self._record("timeout")
+            raise LLMUnavailable(f"no answer within {LLM_TIMEOUT}s")
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except Exception:
+            self._record("error")
+            raise
+        finally:
+            self._release_slot()
+        self._record("ok", started)
+        return answer
+
+    async def _request(self, messages: List[Dict[str, str]]) -> str:
+        response = await self.client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            temperature=0.3
+        )
+        return response.choices[0].message.content
+
+    async def _stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Streaming _complete: first token within LLM_TIMEOUT, whole answer within LLM_STREAM_TIMEOUT."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LLM_TIMEOUT
+        stream_deadline = loop.time() + LLM_STREAM_TIMEOUT
+        await self._acquire_slot(deadline)
+        outcome = None
+        stream = None
+        try:
+            stream = await asyncio.wait_for(self.client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                temperature=0.3,
+                stream=True
+            ), deadline - loop.time())
+            chunks = stream.__aiter__()
+            while True:
+                # Timeouts are applied per chunk (never around a yield, which would hit the consumer)
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                except StopAsyncIteration:
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if deadline != stream_deadline:
+                        observe_stage("llm.stream.first_token", time.perf_counter() - started)
+                    deadline = stream_deadline
+                    yield delta
+            outcome = "ok"
+        except TimeoutError:
+            outcome = "timeout"
+            raise LLMUnavailable(f"stream exceeded its deadline ({LLM_TIMEOUT}s first token, {LLM_STREAM_TIMEOUT}s total)")
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.abandon()
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self._release_slot()
+            if outcome is not None:
+                self._record(outcome, started)
+                observe_stage("llm.stream", time.perf_counter() - started)
+            if stream is not None and outcome != "ok":
+                # Drop the HTTP response instead of leaving it half-read
+                await stream.close()
+
+    def cached_response(self, user_query: str, evidence: List[Dict], verdict: str) -> Optional[str]:
+        return self.cache.get(self.cache_key(user_query, evidence, verdict))
+
+    def prefetch(self, user_query: str, evidence: List[Dict], verdict: str):
         """
-        Generates a response grounded ONLY in the provided evidence.
-        Returns fallback_text if LLM is unavailable.
+        Generates and caches the LLM answer in a background task, without waiting for it.
+        Used when the request itself was answered from a template: the next identical query
+        (same evidence) gets the LLM phrasing straight from the cache.
         """
         if not self.client:
-            return fallback_text or self._mock_response(user_query, verdict)
+            return
+        key = self.cache_key(user_query, evidence, verdict)
+        if key in self._prefetching or self.cache.get(key) is not None:
+            return
+        if len(self._prefetching) >= PREFETCH_MAX_PENDING:
+            self.prefetch_stats["dropped"] += 1
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._prefetch_answer(key, user_query, evidence, verdict), context=background_context()
+        )
+        self._prefetching[key] = task
+        task.add_done_callback(lambda _: self._prefetching.pop(key, None))
+        self.prefetch_stats["scheduled"] += 1
+
+    async def _prefetch_answer(self, key: Tuple, user_query: str, evidence: List[Dict], verdict: str):
+        # Own slots and no say in the circuit breaker: a burst of background fills can neither take
+        # the request path's slots nor open the circuit and push real requests to the fallback
+        async with self._prefetch_slots:
+            if self.breaker.state != "closed":
+                self.prefetch_stats["skipped"] += 1
+                return
+            try:
+                with span("llm.prefetch", model=LLM_MODEL):
+                    async with asyncio.timeout(LLM_TIMEOUT):
+                        answer = await self._request(self._build_messages(user_query, evidence, verdict))
+            except Exception:
+                self.prefetch_stats["failed"] += 1
+                return
+        self._cache_answer(key, evidence, answer)
+        self.prefetch_stats["completed"] += 1
 
+    async def aclose(self):
+        # Pending background fills are best-effort: drop them on shutdown
+        tasks = list(self._prefetching.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _build_messages(self, user_query: str, evidence: List[Dict], verdict: str) -> List[Dict[str, str]]:
         # Construct Context from Evidence
         context_str = ""
         for item in evidence:
@@ -48,20 +374,75 @@ Evidence:
 
 Generate a patient-friendly response:"""
 
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    async def generate_grounded_response(self, user_query: str, evidence: List[Dict], verdict: str, fallback_text: str = "") -> str:
+        """
+        Generates a response grounded ONLY in the provided evidence.
+        Returns fallback_text if LLM is unavailable.
+        """
+        answer, _ = await self.grounded_answer(user_query, evidence, verdict, fallback_text)
+        return answer
+
+    async def grounded_answer(self, user_query: str, evidence: List[Dict], verdict: str, fallback_text: str = "") -> Tuple[str, str]:
+        """generate_grounded_response plus where the answer came from: "cached", "llm" or "fallback"."""
+        if not self.client:
+            return fallback_text or self._mock_response(user_query, verdict), "fallback"
+
+        key = self.cache_key(user_query, evidence, verdict)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, "cached"
+
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini", 
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3
-            )
-            return response.choices[0].message.content
+            answer = await self._complete(self._build_messages(user_query, evidence, verdict))
+            self._cache_answer(key, evidence, answer)
+            return answer, "llm"
         except Exception as e:
-            print(f"❌ LLM Error: {e}")
+            if not isinstance(e, LLMUnavailable):
+                print(f"❌ LLM Error: {e}")
             # Fallback to the Rule-Based Answer (Hybrid Mode)
-            return fallback_text if fallback_text else self._mock_response(user_query, verdict, str(e))
+            return (fallback_text if fallback_text else self._mock_response(user_query, verdict, str(e))), "fallback"
+
+    async def stream_grounded_response(self, user_query: str, evidence: List[Dict], verdict: str, fallback_text: str = "",
+                                       meta: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        Same as generate_grounded_response, but yields the answer token by token (stream=True).
+        If the LLM is unavailable or fails before producing anything, yields the fallback in one chunk.
+        meta["tier"] is set to "cached", "llm" or "fallback" (as in grounded_answer).
+        """
+        meta = meta if meta is not None else {}
+        meta["tier"] = "fallback"
+        if not self.client:
+            yield fallback_text or self._mock_response(user_query, verdict)
+            return
+
+        key = self.cache_key(user_query, evidence, verdict)
+        cached = self.cache.get(key)
+        if cached is not None:
+            meta["tier"] = "cached"
+            yield cached
+            return
+
+        chunks = []
+        try:
+            async for delta in self._stream(self._build_messages(user_query, evidence, verdict)):
+                meta["tier"] = "llm"
+                chunks.append(delta)
+                yield delta
+        except Exception as e:
+            if not isinstance(e, LLMUnavailable):
+                print(f"❌ LLM Error: {e}")
+            if not chunks:
+                yield fallback_text if fallback_text else self._mock_response(user_query, verdict, str(e))
+            return
+        if not chunks:
+            yield fallback_text or self._mock_response(user_query, verdict)
+            return
+        self._cache_answer(key, evidence, "".join(chunks))
 
     def _mock_response(self, query: str, verdict: str, error_msg: str = "") -> str:
         """Fallback if no API key or error."""
@@ -1,21 +1,122 @@
 from dotenv import load_dotenv
 load_dotenv() # Load env vars from .env BEFORE other imports
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from typing import List
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
 from app.schemas import (
-    IngestTextRequest, IngestImageRequest, SearchRequest, SearchResponse,
-    AgentQueryRequest, AgentResponse, MemoryUpdateRequest, SearchResultItem
+    IngestTextRequest, IngestImageRequest, SearchRequest, SearchResponse, SearchFilters,
+    AgentQueryRequest, AgentResponse, MemoryUpdateRequest, SearchResultItem,
+    BatchSearchRequest, BatchSearchResponse, BatchAgentQueryRequest, BatchAgentResponse
 )
 from app.agent import MisinformationAgent
-from app.qdrant_client_wrapper import QdrantHandler
+from app.image_pipeline import encode_image_files
+from app import metrics
+from app.embeddings import torch_thread_settings
+from app.profiling import PROFILER, thread_summary
 from qdrant_client.http import models
+import asyncio
+import gc
+import json
 import uuid
 import os
+import secrets
+import time
 
-app = FastAPI(title="Multimodal Misinformation Assistant")
+# Models to pre-load in the background at startup, e.g. "text" or "text,clip" (empty = fully lazy)
+WARMUP_MODELS = [m.strip() for m in os.getenv("HEALTHGUARD_WARMUP", "").split(",") if m.strip()]
+# Largest accepted list of queries for the /batch endpoints
+MAX_BATCH_QUERIES = int(os.getenv("HEALTHGUARD_MAX_BATCH_QUERIES", "1024"))
+# Collection initialisation at startup: first retry delay and backoff cap, in seconds
+INIT_DB_RETRY_DELAY = float(os.getenv("HEALTHGUARD_INIT_DB_RETRY_DELAY", "1"))
+INIT_DB_RETRY_MAX_DELAY = float(os.getenv("HEALTHGUARD_INIT_DB_RETRY_MAX_DELAY", "30"))
+# Shared secret for the /admin endpoints (sent as X-Admin-Token); unset = the endpoints don't exist
+ADMIN_TOKEN = os.getenv("HEALTHGUARD_ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def _check_batch_size(queries: List[str]):
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch (got {len(queries)})")
+
+# Cheap to construct: models load lazily and collections are initialised in the lifespan below
+agent = MisinformationAgent(init_db=False)
+# Direct-access endpoints share the agent's (process-wide) handler and connection pool
+db = agent.db
+
+async def _init_db():
+    # Retried with exponential backoff until Qdrant is reachable; readiness stays 503 meanwhile
+    delay = INIT_DB_RETRY_DELAY
+    while True:
+        try:
+            await asyncio.to_thread(agent.init_db)
+            return
+        except Exception as e:
+            print(f"❌ Failed to initialise collections: {e} (retrying in {delay:.0f}s)")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, INIT_DB_RETRY_MAX_DELAY)
+
+def preload_for_workers(models: Optional[List[str]] = None):
+    """
+    Runs once in the gunicorn master before it forks the workers (see gunicorn.conf.py): loads the
+    embedding models and initialises the collections, so workers share the model weights
+    copy-on-write and none of them repeats init_collections.
+    """
+    if "embedded" in db.backend_kinds():
+        raise RuntimeError("Embedded Qdrant locks its storage to one process; use the remote backend with several workers")
+    agent.embedder.warm_up(models or WARMUP_MODELS or ["text", "clip"], background=False)
+    agent.init_db()
+    # Keep the loaded objects out of the GC's generations: collections in the workers would
+    # otherwise touch (and un-share) every page holding them
+    gc.collect()
+    gc.freeze()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Don't block serving on Qdrant or torch: readiness reports progress instead
+    # (preloaded workers inherit initialised collections and loaded models from the master)
+    init_task = asyncio.create_task(_init_db()) if not agent.db_ready else None
+    if WARMUP_MODELS:
+        agent.embedder.warm_up(WARMUP_MODELS, background=True)
+    yield
+    if init_task is not None:
+        init_task.cancel()
+    await agent.llm.aclose()
+    await agent.memory.aclose()
+
+app = FastAPI(title="Multimodal Misinformation Assistant", lifespan=lifespan)
+
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    """
+    Per-request trace: every span below (embedding, Qdrant, memory, LLM...) is collected, the
+    request latency goes to healthguard_http_request_seconds, and with HEALTHGUARD_TIMING_HEADER
+    (or an `X-Debug-Timing: 1` request header) the stage breakdown is returned as Server-Timing.
+    Streaming responses are timed up to their first byte.
+    """
+    trace, token = metrics.start_trace()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        # Route templates (not raw paths) keep the label set bounded
+        metrics.HTTP_SECONDS.observe(elapsed, method=request.method, route=route, status=str(status))
+        PROFILER.request_finished(route)
+        metrics.end_trace(token)
+    if metrics.wants_timing_header(request.headers):
+        response.headers["Server-Timing"] = metrics.server_timing(trace, elapsed)
+        response.headers["X-Trace-Id"] = trace.trace_id
+    return response
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -24,100 +125,242 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 async def read_root():
     return FileResponse('app/static/index.html')
 
-agent = MisinformationAgent()
-# Re-init db handler for direct access if needed
-db = QdrantHandler() 
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    models_loaded = agent.embedder.loaded_models()
+    warm = agent.embedder.loaded_models_for(WARMUP_MODELS)
+    ready = agent.db_ready and warm
+    body = {
+        "status": "ready" if ready else "starting",
+        "collections_initialized": agent.db_ready,
+        "models_loaded": models_loaded,
+        "model_load_seconds": agent.embedder.load_times(),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
 
 @app.post("/ingest/text")
 async def ingest_text(request: IngestTextRequest):
-    points = []
     embedder = agent.embedder
-    for doc in request.documents:
-        vector = embedder.encode_text(doc.body)
-        points.append(models.PointStruct(
+    # One bulk encode for the whole request; documents are one-off, keep them out of the query cache
+    vectors = await embedder.aencode_texts([doc.body for doc in request.documents], use_cache=False)
+    points = [
+        models.PointStruct(
             id=str(uuid.uuid5(uuid.NAMESPACE_DNS, doc.doc_id)),
             vector=vector,
             payload=doc.dict()
-        ))
+        )
+        for doc, vector in zip(request.documents, vectors)
+    ]
 
-    db.upsert_points(db.COL_FACTS, points)
+    await db.aupsert_points(db.COL_FACTS, points)
     return {"status": "success", "count": len(points)}
 
 @app.post("/ingest/images")
 async def ingest_images(request: IngestImageRequest):
-    points = []
     embedder = agent.embedder
-    for img in request.images:
-        # Note: In a real API, we might fetch image from URL or path. 
-        # Here we assume file_path is local and valid as per simplified requirements.
-        try:
-            vector = embedder.encode_image(img.file_path)
-            points.append(models.PointStruct(
-                id=str(uuid.uuid5(uuid.NAMESPACE_DNS, img.img_id)),
-                vector=vector,
-                payload=img.dict()
-            ))
-        except Exception as e:
-            print(f"Failed to process image {img.file_path}: {e}")
+    # Note: In a real API, we might fetch image from URL or path. 
+    # Here we assume file_path is local and valid as per simplified requirements.
+    # Decode/resize on a thread pool and encode in CLIP batches, off the event loop
+    paths = [img.file_path for img in request.images]
+    encoded = await asyncio.to_thread(lambda: list(encode_image_files(embedder, paths, use_processes=False)))
+
+    points = []
+    for img, (_, vector) in zip(request.images, encoded):
+        if vector is None:
             continue
+        points.append(models.PointStruct(
+            id=str(uuid.uuid5(uuid.NAMESPACE_DNS, img.img_id)),
+            vector=vector,
+            payload=img.dict()
+        ))
             
-    db.upsert_points(db.COL_IMAGES, points)
+    await db.aupsert_points(db.COL_IMAGES, points)
     return {"status": "success", "count": len(points)}
 
-@app.get("/search", response_model=SearchResponse)
-async def search(q: str, type: str = "all", top_k: int = 5):
-    # Direct search endpoint
-    results = []
-    
-    # Text Search matches
-    # Text Search matches (Searching FACTS only for direct search endpoint)
-    if type in ["text", "all"]:
-        q_vec = agent.embedder.encode_text(q)
-        hits = db.search(db.COL_FACTS, q_vec, top_k=top_k)
-        for h in hits:
-            results.append(SearchResultItem(
-                id=str(h.id),
-                score=h.score,
-                content=h.payload.get('body', ''),
-                metadata=h.payload,
-                type="fact",
-                source_collection="medical_facts"
-            ))
-
-    # Image Search matches
-    if type in ["image", "all"]:
-        q_vec = agent.embedder.encode_text_for_image_search(q)
-        hits = db.search(db.COL_IMAGES, q_vec, top_k=top_k)
-        for h in hits:
-            results.append(SearchResultItem(
-                id=str(h.id),
-                score=h.score,
-                content=h.payload.get('caption', ''),
-                metadata=h.payload,
-                type="image",
-                source_collection="medical_images"
-            ))
-            
+def _search_types(type: str, filters: SearchFilters) -> set:
+    # content_type narrows the requested type further ("all" on both sides = both collections)
+    types = {"text", "image"} if type == "all" else {type}
+    if filters.content_type and filters.content_type != "all":
+        types &= {filters.content_type}
+    return types
+
+def _fact_items(hits) -> List[SearchResultItem]:
+    return [SearchResultItem(
+        id=str(h.id),
+        score=h.score,
+        content=h.payload.get('body', ''),
+        metadata=h.payload,
+        type="fact",
+        source_collection="medical_facts"
+    ) for h in hits]
+
+def _image_items(hits) -> List[SearchResultItem]:
+    return [SearchResultItem(
+        id=str(h.id),
+        score=h.score,
+        content=h.payload.get('caption', ''),
+        metadata=h.payload,
+        type="image",
+        source_collection="medical_images"
+    ) for h in hits]
+
+def _merge_results(results: List[SearchResultItem], top_k: int) -> SearchResponse:
     # Sort composite results by score
     results.sort(key=lambda x: x.score, reverse=True)
     return SearchResponse(results=results[:top_k])
 
+async def _search(query: str, type: str = "all", top_k: int = 5, filters: SearchFilters = None) -> SearchResponse:
+    filters = filters or SearchFilters()
+    types = _search_types(type, filters)
+    # topic / source / min_date are pushed down into Qdrant (indexed payload fields)
+    payload_filters = filters.payload_filters()
+
+    # Text (FACTS only for the direct search endpoint) and image matches: both encode+search
+    # chains run concurrently
+    searches = []
+    if "text" in types:
+        searches.append(_search_text(query, top_k, payload_filters))
+    if "image" in types:
+        searches.append(_search_image(query, top_k, payload_filters))
+    results = [item for items in await asyncio.gather(*searches) for item in items]
+
+    return _merge_results(results, top_k)
+
+async def _search_text(query: str, top_k: int, payload_filters) -> List[SearchResultItem]:
+    q_vec = await agent.embedder.aencode_text(query)
+    return _fact_items(await db.asearch(db.COL_FACTS, q_vec, top_k=top_k, filters=payload_filters))
+
+async def _search_image(query: str, top_k: int, payload_filters) -> List[SearchResultItem]:
+    q_vec = await agent.embedder.aencode_text_for_image_search(query)
+    return _image_items(await db.asearch(db.COL_IMAGES, q_vec, top_k=top_k, filters=payload_filters))
+
+async def _search_text_batch(queries: List[str], top_k: int, payload_filters) -> List[List[SearchResultItem]]:
+    vectors = await agent.embedder.aencode_texts(queries)
+    return [_fact_items(hits) for hits in await db.asearch_batch(db.COL_FACTS, vectors, top_k=top_k, filters=payload_filters)]
+
+async def _search_image_batch(queries: List[str], top_k: int, payload_filters) -> List[List[SearchResultItem]]:
+    vectors = await agent.embedder.aencode_texts_for_image_search(queries)
+    return [_image_items(hits) for hits in await db.asearch_batch(db.COL_IMAGES, vectors, top_k=top_k, filters=payload_filters)]
+
+@app.get("/search", response_model=SearchResponse)
+async def search(q: str, type: str = "all", top_k: int = 5):
+    # Direct search endpoint
+    return await _search(q, type, top_k)
+
+@app.post("/search", response_model=SearchResponse)
+async def search_filtered(request: SearchRequest):
+    # Same as GET /search, plus SearchFilters (topics, source, content_type, min_date)
+    return await _search(request.query, request.type, request.top_k, request.filters)
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest):
+    """
+    POST /search for many queries: one encode call per model and one query_batch_points
+    round trip per collection. Results are in query order.
+    """
+    _check_batch_size(request.queries)
+    filters = request.filters or SearchFilters()
+    types = _search_types(request.type, filters)
+    payload_filters = filters.payload_filters()
+    empty = [[] for _ in request.queries]
+
+    text_results, image_results = await asyncio.gather(
+        _search_text_batch(request.queries, request.top_k, payload_filters) if "text" in types else asyncio.sleep(0, empty),
+        _search_image_batch(request.queries, request.top_k, payload_filters) if "image" in types else asyncio.sleep(0, empty),
+    )
+    return BatchSearchResponse(results=[
+        _merge_results(texts + images, request.top_k) for texts, images in zip(text_results, image_results)
+    ])
+
 @app.post("/agent/query", response_model=AgentResponse)
 async def agent_query(request: AgentQueryRequest):
-    return agent.process_query(request)
+    return await agent.process_query(request)
+
+@app.post("/agent/query/batch", response_model=BatchAgentResponse)
+async def agent_query_batch(request: BatchAgentQueryRequest):
+    # Bulk fact-checking: verdicts for every claim, LLM answers / memory only when asked for
+    _check_batch_size(request.queries)
+    return await agent.process_batch(request)
+
+@app.post("/agent/query/stream")
+async def agent_query_stream(request: AgentQueryRequest):
+    """
+    Server-Sent Events: `verdict` (verdict, reasoning, evidence) as soon as retrieval is scored,
+    then `token` events with the LLM answer, then `done`.
+    """
+    async def events():
+        try:
+            async for event, data in agent.stream_query(request):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            print(f"❌ Stream Error: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/embeddings/stats")
+async def embedding_stats():
+    # Micro-batching queue depth / batch-size distribution per model, plus query-embedding cache counters
+    return {"batching": agent.embedder.batch_stats(), "cache": agent.embedder.cache_stats()}
+
+@app.get("/llm/stats")
+async def llm_stats():
+    # Grounded-answer cache counters, LLM call outcomes/latency and circuit breaker state
+    return {"answer_cache": agent.llm.cache_stats(), "llm": agent.llm.llm_stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    # Prometheus scrape target: stage/request histograms, cache, queue and LLM gauges
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/traces")
+async def recent_traces(limit: int = 20):
+    # Spans of the most recent requests (newest first), for ad-hoc latency debugging
+    return {"traces": metrics.recent_traces(limit)}
+
+@app.get("/memory/stats")
+async def memory_stats():
+    # Write-behind reinforcement buffer state
+    return agent.memory.reinforcer.stats()
 
 @app.get("/memory")
 async def get_memory(user_id: str, query: str):
-    return agent.memory.get_context(user_id, query)
+    return await agent.memory.get_context(user_id, query)
 
 @app.post("/memory/update")
 async def update_memory(request: MemoryUpdateRequest):
     # Manual memory override
     if request.action == "upsert":
-        agent.memory.add_memory(
+        await agent.memory.add_memory(
             request.item.user_id, 
             request.item.session_id, 
             request.item.raw_text, 
             request.item.memory_type
         )
     return {"status": "updated"}
+
+# --- Admin: live profiling (requires HEALTHGUARD_ADMIN_TOKEN) ---
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(mode: Literal["sampling", "cprofile"] = "sampling", requests: int = 20, max_seconds: float = 30.0,
+                  route: str = "/agent/query", interval_ms: float = 5.0, include_idle: bool = False):
+    """
+    Profiles this worker until `requests` requests to `route` have completed (or `max_seconds`).
+    sampling: collapsed stacks of every thread (flamegraph.pl / speedscope); cprofile: pstats
+    report of the event-loop thread. Send the traffic to the same worker while this call waits.
+    """
+    if PROFILER.busy:
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+    session = await PROFILER.capture(mode, route, max(1, requests), max_seconds, max(0.5, interval_ms), include_idle)
+    filename = f"profile-{int(time.time())}.{'folded' if mode == 'sampling' else 'txt'}"
+    headers = {f"X-Profile-{k.title()}": v for k, v in session.summary().items()}
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return PlainTextResponse(session.output(), headers=headers)
+
+@app.get("/admin/runtime", dependencies=[Depends(require_admin)])
+async def runtime_info():
+    # torch thread pools vs. cores, plus the threads alive in this worker
+    return {"pid": os.getpid(), "torch": torch_thread_settings(), "threads": thread_summary()}
@@ -1,19 +1,198 @@
+import asyncio
+import os
 import uuid
 import time
-from typing import List, Optional
+import numpy as np
+from typing import Any, Dict, List, Optional
 from qdrant_client.http import models
 from app.qdrant_client_wrapper import QdrantHandler
 from app.embeddings import EmbeddingModel
 from app.schemas import MemoryItem
+from app.metrics import REGISTRY, background_context, span
+
+# Write-behind reinforcement: flush every N seconds or once this many points are pending
+REINFORCE_FLUSH_INTERVAL = float(os.getenv("HEALTHGUARD_REINFORCE_FLUSH_INTERVAL", "2.0"))
+REINFORCE_MAX_PENDING = int(os.getenv("HEALTHGUARD_REINFORCE_MAX_PENDING", "256"))
+# Weight bonus per recall, on a log scale: 1 + BOOST * ln(access_count)
+REINFORCE_BOOST = 0.1
+# A recall within this many seconds of the last persisted one isn't written again
+# (it would barely move the decay and costs a payload write per hit)
+REINFORCE_MIN_INTERVAL = float(os.getenv("HEALTHGUARD_REINFORCE_MIN_INTERVAL", "3600"))
+# Failed flushes are retried with the next one; an update failing this many times is dropped
+REINFORCE_MAX_ATTEMPTS = int(os.getenv("HEALTHGUARD_REINFORCE_MAX_ATTEMPTS", "3"))
+
+# Time-aware ranking: score = similarity * decay_weight * recall bonus * 0.5 ** (age / half-life),
+# with age = now - last_accessed computed at read time (nothing is stored as it decays)
+MEMORY_HALF_LIFE_HOURS = float(os.getenv("HEALTHGUARD_MEMORY_HALF_LIFE_HOURS", "168"))
+# Candidates fetched by similarity per memory returned, before re-ranking by decayed weight
+MEMORY_OVERFETCH = int(os.getenv("HEALTHGUARD_MEMORY_OVERFETCH", "4"))
+
+def memory_weights(decay_weight, access_count, last_accessed, now: float,
+                   half_life_hours: float = MEMORY_HALF_LIFE_HOURS) -> np.ndarray:
+    """Time-decayed weight of each memory (vectorized over the candidates)."""
+    weight = np.asarray(decay_weight, dtype=float)
+    recalls = np.maximum(np.asarray(access_count, dtype=float), 1.0)
+    weight = weight * (1.0 + REINFORCE_BOOST * np.log(recalls))
+    if half_life_hours > 0:
+        age = np.maximum(now - np.asarray(last_accessed, dtype=float), 0.0)
+        weight = weight * np.exp2(-age / (3600.0 * half_life_hours))
+    return weight
+
+class ReinforcementBuffer:
+    """
+    Collects memory reinforcement updates off the request path.
+    Repeated hits on the same point are merged, and pending updates are flushed as ONE
+    batch_update_points call on a timer, on a size threshold, or at shutdown.
+    """
+
+    def __init__(self, db: QdrantHandler, collection: str, flush_interval: float = REINFORCE_FLUSH_INTERVAL,
+                 max_pending: int = REINFORCE_MAX_PENDING):
+        self.db = db
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # point_id -> {"base_count", "hits", "last_accessed", "attempts"}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Entries of the flush being written right now
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+        self.flushes = 0
+        self.points_written = 0
+        self.hits_merged = 0
+        self.hits_skipped = 0
+        self.points_dropped = 0
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._flush_lock = asyncio.Lock()
+            self._task = loop.create_task(self._run(), name="memory-reinforce-flush", context=background_context())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def record(self, point_id: str, access_count: int, last_accessed: float) -> Dict[str, Any]:
+        """
+        Registers one recall of `point_id` and returns its reinforced (not yet persisted) values.
+        Recalls of a point refreshed less than REINFORCE_MIN_INTERVAL ago are dropped (no write).
+        """
+        self._ensure_task()
+        now = time.time()
+        entry = self._pending.get(point_id)
+        if entry is None:
+            inflight = self._inflight.get(point_id)
+            if inflight is not None:
+                # Being written right now: build on the values in flight, not the stale ones the
+                # search read (otherwise the next flush would overwrite the count being flushed)
+                persisted = self._payload(inflight)
+                access_count, last_accessed = persisted["access_count"], persisted["last_accessed"]
+            if now - last_accessed < REINFORCE_MIN_INTERVAL:
+                self.hits_skipped += 1
+                return {"access_count": access_count, "last_accessed": last_accessed}
+            entry = {"base_count": access_count, "hits": 0, "attempts": 0}
+            self._pending[point_id] = entry
+        else:
+            self.hits_merged += 1
+        entry["hits"] += 1
+        entry["last_accessed"] = now
+
+        if len(self._pending) >= self.max_pending:
+            self._loop.create_task(self.flush(), context=background_context())
+        return self._payload(entry)
+
+    @staticmethod
+    def _payload(entry: Dict[str, Any]) -> Dict[str, Any]:
+        # decay_weight (the memory's base importance) is never rewritten: decay and the recall
+        # bonus are derived from these two fields at read time
+        return {
+            "access_count": entry["base_count"] + entry["hits"],
+            "last_accessed": entry["last_accessed"],
+        }
+
+    def discard(self, point_id: str):
+        self._pending.pop(point_id, None)
+        self._inflight.pop(point_id, None)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            self._inflight = pending
+            # Only the reinforcement fields are written; the rest of the payload is untouched
+            updates = {point_id: self._payload(entry) for point_id, entry in pending.items()}
+            try:
+                with span("memory.reinforce_flush", points=len(updates)):
+                    await self.db.abatch_set_payloads(self.collection, updates)
+                self.flushes += 1
+                self.points_written += len(updates)
+            except Exception as e:
+                print(f"[Memory] Failed to flush {len(updates)} reinforcement updates: {e}")
+                self._requeue(pending)
+            finally:
+                self._inflight = {}
+
+    def _requeue(self, failed: Dict[str, Dict[str, Any]]):
+        # Back into the buffer for the next flush. A point recalled again meanwhile already has a
+        # newer entry built on the failed one's count, which supersedes it; discarded points stay out.
+        for point_id, entry in failed.items():
+            if point_id in self._pending or point_id not in self._inflight:
+                continue
+            entry["attempts"] += 1
+            if entry["attempts"] >= REINFORCE_MAX_ATTEMPTS:
+                self.points_dropped += 1
+                continue
+            self._pending[point_id] = entry
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "points_written": self.points_written,
+            "hits_merged": self.hits_merged,
+            "hits_skipped": self.hits_skipped,
+            "points_dropped": self.points_dropped,
+        }
+
+    def metric_samples(self):
+        return [
+            ("healthguard_memory_reinforce_pending", "gauge", "Reinforcement updates waiting to be flushed.", [({}, len(self._pending))]),
+            ("healthguard_memory_reinforce_flushes_total", "counter", "Reinforcement batch writes.", [({}, self.flushes)]),
+            ("healthguard_memory_reinforce_points_total", "counter", "Memory points rewritten by reinforcement.", [({}, self.points_written)]),
+            ("healthguard_memory_reinforce_skipped_total", "counter", "Recalls not written (point refreshed recently).", [({}, self.hits_skipped)]),
+            ("healthguard_memory_reinforce_dropped_total", "counter", "Reinforcement updates dropped after repeated flush failures.", [({}, self.points_dropped)]),
+        ]
 
 class MemoryManager:
     def __init__(self, db: QdrantHandler, embedder: EmbeddingModel):
         self.db = db
         self.embedder = embedder
         self.COLLECTION = db.COL_MEMORY
+        self.reinforcer = ReinforcementBuffer(db, self.COLLECTION)
+        REGISTRY.register_collector(self.reinforcer.metric_samples)
 
-    def add_memory(self, user_id: str, session_id: str, text: str, memory_type: str = "summary"):
-        vector = self.embedder.encode_text(text)
+    async def add_memory(self, user_id: str, session_id: str, text: str, memory_type: str = "summary"):
+        with span("memory.store", memory_type=memory_type):
+            return await self._add_memory(user_id, session_id, text, memory_type)
+
+    async def _add_memory(self, user_id: str, session_id: str, text: str, memory_type: str):
+        # Memory texts are one-off, keep them out of the query-embedding cache
+        vector = await self.embedder.aencode_text(text, use_cache=False)
         mem_id = str(uuid.uuid4())
         
         payload = {
@@ -28,49 +207,64 @@ class MemoryManager:
         }
         
         point = models.PointStruct(id=mem_id, vector=vector, payload=payload)
-        self.db.upsert_points(self.COLLECTION, [point])
+        await self.db.aupsert_points(self.COLLECTION, [point])
         print(f"[Memory] Stored ({memory_type}): {text[:30]}...")
         return mem_id
 
-    def get_context(self, user_id: str, query: str, top_k=3) -> List[MemoryItem]:
-        query_vector = self.embedder.encode_text(query)
+    async def get_context(self, user_id: str, query: str, top_k=3) -> List[MemoryItem]:
+        with span("memory.context", top_k=top_k):
+            return await self._get_context(user_id, query, top_k)
+
+    async def _get_context(self, user_id: str, query: str, top_k: int) -> List[MemoryItem]:
+        query_vector = await self.embedder.aencode_text(query)
         filters = {"user_id": user_id}
         
-        results = self.db.search(self.COLLECTION, query_vector, top_k=top_k, filters=filters)
+        # Over-fetch by similarity, then re-rank by similarity x time-decayed weight
+        results = await self.db.asearch(self.COLLECTION, query_vector, top_k=top_k * MEMORY_OVERFETCH, filters=filters)
+        if not results:
+            return []
+
+        # --- MEMORY EVOLUTION LOGIC ---
+        # 1. Decay: a memory's weight halves every MEMORY_HALF_LIFE_HOURS since it was last recalled
+        # 2. Reinforcement: recalls raise access_count and refresh last_accessed (see memory_weights)
+        now = time.time()
+        payloads = [res.payload for res in results]
+        last_accessed = [p.get("last_accessed") or float(p.get("timestamp") or now) for p in payloads]
+        weights = memory_weights(
+            [p.get("decay_weight", 1.0) for p in payloads],
+            [p.get("access_count", 1) for p in payloads],
+            last_accessed,
+            now,
+        )
+        scores = np.asarray([res.score for res in results]) * weights
+        # Stable sort: equal scores keep the similarity order
+        order = np.argsort(-scores, kind="stable")[:top_k]
         
         memories = []
-        updates = []
-        
-        for res in results:
-            data = res.payload
-            mem_item = MemoryItem(**data)
+        for i in order:
+            res = results[i]
+            mem_item = MemoryItem(**{**res.payload, "last_accessed": last_accessed[i]}, score=float(scores[i]))
             
-            # --- MEMORY EVOLUTION LOGIC ---
-            # 1. Decay: Older memories accessed less frequently might have lower relevance (simulated here)
-            # 2. Reinforcement: Every time we retrieve it, we boost its "access_count"
-            
-            new_count = mem_item.access_count + 1
-            new_weight = mem_item.decay_weight + 0.1 # Boost importance on recall
-            
-            # Update local object
-            mem_item.access_count = new_count
-            mem_item.decay_weight = new_weight
-            mem_item.last_accessed = time.time()
+            # Queued in the write-behind buffer (merged per point, flushed in batches off the request path)
+            reinforced = self.reinforcer.record(str(res.id), mem_item.access_count, mem_item.last_accessed)
+            mem_item.access_count = reinforced["access_count"]
+            mem_item.last_accessed = reinforced["last_accessed"]
             
             memories.append(mem_item)
             
-            # Queue update to DB (Reinforcement) - Use payload update to avoid vector requirement
-            try:
-                self.db.update_payload(self.COLLECTION, mem_item.dict(), str(res.id))
-            except Exception as e:
-                print(f"[Memory] Failed to reinforce memory {res.id}: {e}")
-            
-        print(f"[Memory] Reinforced {len(memories)} memories.")
-
+        print(f"[Memory] Recalled {len(memories)} of {len(results)} candidates.")
             
         return memories
 
-    def forget_memory(self, user_id: str, memory_id: str):
+    async def flush(self):
+        await self.reinforcer.flush()
+
+    async def aclose(self):
+        # Graceful shutdown: persist any pending reinforcement updates
+        await self.reinforcer.aclose()
+
+    async def forget_memory(self, user_id: str, memory_id: str):
         # Implementation for "Deletion" requirement
-        self.db.delete_point(self.COLLECTION, memory_id)
+        self.reinforcer.discard(memory_id)
+        await self.db.adelete_point(self.COLLECTION, memory_id)
         print(f"[Memory] Deleted memory {memory_id}")
@@ -0,0 +1,254 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    # Optional: when an OpenTelemetry SDK is configured, every span is exported there as well
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# Histogram buckets (seconds) for stage and request timings
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Server-Timing response header: "always", "never", or "on-request" (client sends X-Debug-Timing: 1)
+TIMING_HEADER = os.getenv("HEALTHGUARD_TIMING_HEADER", "on-request")
+# Finished request traces kept for GET /metrics/traces
+RECENT_TRACES = int(os.getenv("HEALTHGUARD_RECENT_TRACES", "100"))
+
+# (name, type, help, [(labels, value), ...]) as produced by collectors
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics), one series per label set."""
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(dict(key), list(series)) for key, series in self._series.items()]
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': repr(bound)})} {count}")
+            lines.append(f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {series[len(self.buckets)]}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(labels)} {series[len(self.buckets)]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        lines += [f"{self.name}{_labels(dict(key))} {value}" for key, value in items]
+        return lines
+
+
+class Registry:
+    """
+    Metrics owned here (histograms/counters) plus collectors: callables that components register
+    to report their own counters (cache hits, queue depths, ...) at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Optional[Callable[[], List[MetricFamily]]]]] = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float] = STAGE_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect: Callable[[], List[MetricFamily]]):
+        # Bound methods are held weakly so short-lived components (scripts, tests) can be collected
+        ref = weakref.WeakMethod(collect) if hasattr(collect, "__self__") else (lambda: collect)
+        with self._lock:
+            self._collectors.append(ref)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+
+        families: Dict[str, Tuple[str, str, List]] = {}
+        with self._lock:
+            self._collectors = [ref for ref in self._collectors if ref() is not None]
+            collectors = [ref() for ref in self._collectors]
+        for collect in collectors:
+            if collect is None:
+                continue
+            try:
+                for name, kind, help, samples in collect():
+                    families.setdefault(name, (kind, help, []))[2].extend(samples)
+            except Exception as e:
+                print(f"[Metrics] Collector {collect} failed: {e}")
+        for name, (kind, help, samples) in families.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_labels(labels)} {float(value)}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("healthguard_stage_seconds", "Time spent per pipeline stage (span).")
+STAGE_ERRORS = REGISTRY.counter("healthguard_stage_errors_total", "Spans that ended with an exception.")
+HTTP_SECONDS = REGISTRY.histogram("healthguard_http_request_seconds", "HTTP request latency by route and status.")
+
+
+# --- Tracing (OpenTelemetry-style spans, kept per request) ---
+class RequestTrace:
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.time()
+        self.spans: List[Dict[str, Any]] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"trace_id": self.trace_id, "start_time": self.started, "spans": list(self.spans)}
+
+
+_TRACE: contextvars.ContextVar = contextvars.ContextVar("healthguard_trace", default=None)
+_SPAN: contextvars.ContextVar = contextvars.ContextVar("healthguard_span", default=None)
+_RECENT: deque = deque(maxlen=RECENT_TRACES)
+_TRACER = otel_trace.get_tracer("healthguard") if otel_trace is not None else None
+
+
+def start_trace() -> Tuple[RequestTrace, contextvars.Token]:
+    trace = RequestTrace()
+    return trace, _TRACE.set(trace)
+
+def end_trace(token: contextvars.Token):
+    trace = _TRACE.get()
+    _TRACE.reset(token)
+    if trace is not None:
+        _RECENT.append(trace)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _TRACE.get()
+
+def recent_traces(limit: int = 20) -> List[Dict[str, Any]]:
+    return [trace.to_dict() for trace in list(_RECENT)[-limit:]][::-1]
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a block as pipeline stage `name`: always observed in healthguard_stage_seconds, and
+    recorded as a span (trace/span/parent ids, attributes) when running inside a request trace.
+    Usable around awaits; don't hold one open across a `yield` of an async generator.
+    """
+    trace = _TRACE.get()
+    parent_id = _SPAN.get()
+    span_id = uuid.uuid4().hex[:16]
+    token = _SPAN.set(span_id)
+    otel = _TRACER.start_as_current_span(name, attributes=attributes) if _TRACER is not None else nullcontext()
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        with otel:
+            yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _SPAN.reset(token)
+        STAGE_SECONDS.observe(duration, stage=name)
+        if error is not None:
+            STAGE_ERRORS.inc(stage=name, error=error)
+        if trace is not None:
+            trace.spans.append({
+                "name": name,
+                "trace_id": trace.trace_id,
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "start_time": started_at,
+                "duration_ms": round(1000 * duration, 3),
+                "attributes": attributes,
+                "status": "error" if error else "ok",
+                **({"error": error} if error else {}),
+            })
+
+def background_context() -> contextvars.Context:
+    # For long-lived/background tasks started from a request: their spans must not attach to it
+    return contextvars.Context()
+
+def observe_stage(name: str, seconds: float):
+    # For work that isn't a single block (background flushes, streams): histogram only
+    STAGE_SECONDS.observe(seconds, stage=name)
+
+def wants_timing_header(headers) -> bool:
+    if TIMING_HEADER == "always":
+        return True
+    if TIMING_HEADER == "never":
+        return False
+    return headers.get("x-debug-timing", "").lower() in ("1", "true", "yes")
+
+def server_timing(trace: RequestTrace, total_seconds: float) -> str:
+    """Server-Timing header value: time per stage (summed over repeated spans) plus the total."""
+    per_stage: Dict[str, float] = {}
+    for s in trace.spans:
+        per_stage[s["name"]] = per_stage.get(s["name"], 0.0) + s["duration_ms"]
+    entries = [f"{name};dur={ms:.2f}" for name, ms in per_stage.items()]
+    entries.append(f"total;dur={1000 * total_seconds:.2f}")
+    return ", ".join(entries)
+
+
+# --- Collector helpers ---
+def cache_families(cache_name: str, stats: Dict[str, Any]) -> List[MetricFamily]:
+    labels = {"cache": cache_name}
+    return [
+        ("healthguard_cache_hits_total", "counter", "Cache hits (memory + disk tier).", [(labels, stats["hits"] + stats.get("disk_hits", 0))]),
+        ("healthguard_cache_misses_total", "counter", "Cache misses.", [(labels, stats["misses"])]),
+        ("healthguard_cache_evictions_total", "counter", "LRU evictions.", [(labels, stats["evictions"])]),
+        ("healthguard_cache_entries", "gauge", "Entries currently cached.", [(labels, stats["size"])]),
+        ("healthguard_cache_hit_ratio", "gauge", "Hit rate since start.", [(labels, stats["hit_rate"])]),
+    ]
@@ -0,0 +1,170 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+# Upper bound for one capture, whatever the caller asks for
+PROFILE_MAX_SECONDS = float(os.getenv("HEALTHGUARD_PROFILE_MAX_SECONDS", "60"))
+# Leaf frames of threads that are just waiting (event loop select, idle encode workers...)
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+
+def _frame_label(code) -> str:
+    # "function (file.py:first_line)"; ';' is the collapsed-stack separator, so never in a label
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of every thread (sys._current_frames) every `interval` seconds from a
+    daemon thread and counts identical stacks. Cheap enough to run on a live worker; the output
+    is the collapsed format read by flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                # Root = thread name, so the event loop and the encode pool get their own towers
+                stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class DeterministicProfiler:
+    """cProfile on the event-loop thread (every request handler, not the encode threads)."""
+
+    def __init__(self, sort: str = "cumulative", limit: int = 60):
+        self.sort = sort
+        self.limit = limit
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self) -> str:
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).strip_dirs().sort_stats(self.sort).print_stats(self.limit)
+        return out.getvalue()
+
+class ProfileSession:
+    """One capture: ends after `requests` completed requests to `route`, or after `max_seconds`."""
+
+    def __init__(self, mode: str, route: str, requests: int, max_seconds: float, interval_ms: float, include_idle: bool):
+        self.mode = mode
+        self.route = route
+        self.target = requests
+        self.max_seconds = min(max_seconds, PROFILE_MAX_SECONDS)
+        if mode == "sampling":
+            self.profiler = SamplingProfiler(interval_ms / 1000.0, include_idle)
+        elif mode == "cprofile":
+            self.profiler = DeterministicProfiler()
+        else:
+            raise ValueError(f"Unknown profiling mode '{mode}' (expected sampling or cprofile)")
+        self.completed = 0
+        self.seconds = 0.0
+        self._done = asyncio.Event()
+
+    def request_finished(self, route: str):
+        if route == self.route:
+            self.completed += 1
+            if self.completed >= self.target:
+                self._done.set()
+
+    async def run(self):
+        start = time.perf_counter()
+        self.profiler.start()
+        try:
+            await asyncio.wait_for(self._done.wait(), self.max_seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.profiler.stop()
+            self.seconds = time.perf_counter() - start
+
+    def summary(self) -> Dict[str, str]:
+        info = {"mode": self.mode, "route": self.route, "requests": str(self.completed), "seconds": f"{self.seconds:.2f}"}
+        if self.mode == "sampling":
+            info["samples"] = str(self.profiler.samples)
+        return info
+
+    def output(self) -> str:
+        return self.profiler.collapsed() if self.mode == "sampling" else self.profiler.report()
+
+class Profiler:
+    """Process-wide entry point: at most one capture at a time, fed by the HTTP middleware."""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+
+    @property
+    def busy(self) -> bool:
+        return self.session is not None
+
+    def request_finished(self, route: str):
+        if self.session is not None:
+            self.session.request_finished(route)
+
+    async def capture(self, mode: str = "sampling", route: str = "/agent/query", requests: int = 20,
+                      max_seconds: float = 30.0, interval_ms: float = 5.0, include_idle: bool = False) -> ProfileSession:
+        if self.session is not None:
+            raise RuntimeError("A profile capture is already running")
+        session = ProfileSession(mode, route, requests, max_seconds, interval_ms, include_idle)
+        self.session = session
+        try:
+            await session.run()
+        finally:
+            self.session = None
+        return session
+
+def thread_summary() -> Dict[str, int]:
+    # Live threads grouped by name prefix (encode-0, encode-1... -> encode)
+    groups: Dict[str, int] = {}
+    for thread in threading.enumerate():
+        prefix = thread.name.split("_")[0].rstrip("-0123456789") or thread.name
+        groups[prefix] = groups.get(prefix, 0) + 1
+    return groups
+
+PROFILER = Profiler()
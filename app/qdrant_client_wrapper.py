@@ -1,11 +1,124 @@
 import os
-from qdrant_client import QdrantClient
+import threading
+import httpx
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
-from typing import List, Dict, Any, Optional
+from qdrant_client.http.exceptions import ResponseHandlingException
+from app.vector_backends import VectorBackend, QdrantBackend, NumpyBackend
+from app.collection_config import CollectionConfig, PAYLOAD_INDEXES, load_collection_configs
+from app.metrics import span
+from typing import Callable, List, Dict, Any, Optional
+
+# Connection settings (override per deployment instead of the hard-coded localhost:6333)
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# Per-call timeout (seconds) and retry policy for transient transport errors
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))
+QDRANT_RETRIES = int(os.getenv("QDRANT_RETRIES", "2"))
+QDRANT_RETRY_BACKOFF = float(os.getenv("QDRANT_RETRY_BACKOFF", "0.2"))
+# Keep-alive pool size for the REST transport
+QDRANT_MAX_CONNECTIONS = int(os.getenv("QDRANT_MAX_CONNECTIONS", "64"))
+
+# Vector backends: "remote" (Qdrant server), "embedded" (QdrantClient(path=QDRANT_PATH)) or
+# "numpy" (in-process exact search persisted under HEALTHGUARD_NUMPY_PATH).
+# Default for every collection, plus per-collection overrides, e.g.
+# HEALTHGUARD_VECTOR_BACKENDS="medical_facts=numpy,medical_misinfo=numpy"
+VECTOR_BACKEND = os.getenv("HEALTHGUARD_VECTOR_BACKEND", "remote")
+VECTOR_BACKENDS = dict(
+    item.split("=", 1) for item in os.getenv("HEALTHGUARD_VECTOR_BACKENDS", "").split(",") if "=" in item
+)
+QDRANT_PATH = os.getenv("QDRANT_PATH", "qdrant_local")
+NUMPY_PATH = os.getenv("HEALTHGUARD_NUMPY_PATH", "numpy_index")
+# numpy backend: writes are saved to disk at most this often, in seconds (0 = on every write)
+NUMPY_SAVE_DELAY = float(os.getenv("HEALTHGUARD_NUMPY_SAVE_DELAY", "1.0"))
+
+# Errors worth retrying: connection resets, timeouts, gRPC UNAVAILABLE...
+TRANSIENT_ERRORS = (ResponseHandlingException, httpx.TransportError, ConnectionError, TimeoutError)
+try:
+    import grpc
+    TRANSIENT_ERRORS = TRANSIENT_ERRORS + (grpc.RpcError,)
+except ImportError:
+    pass
+
+# --- Process-wide client registry ---
+# One sync and one async client per connection config, shared by every QdrantHandler,
+# so all callers reuse the same keep-alive (or gRPC) connections.
+_CLIENTS: Dict[tuple, Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+_HANDLER: Optional["QdrantHandler"] = None
+_HANDLER_LOCK = threading.Lock()
+
+def _reset_after_fork():
+    # Forked workers (gunicorn --preload) must not share the parent's connection pools or locks:
+    # clients are recreated lazily in each worker. Numpy indexes are kept (shared copy-on-write).
+    global _CLIENTS_LOCK, _HANDLER_LOCK
+    _CLIENTS_LOCK = threading.Lock()
+    _HANDLER_LOCK = threading.Lock()
+    _CLIENTS.clear()
+    if _HANDLER is not None:
+        _HANDLER.reset_connections()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _client_kwargs(prefer_grpc: bool) -> Dict[str, Any]:
+    kwargs = {}
+    if not prefer_grpc:
+        kwargs["limits"] = httpx.Limits(max_connections=QDRANT_MAX_CONNECTIONS, max_keepalive_connections=QDRANT_MAX_CONNECTIONS)
+    return kwargs
+
+def get_client(host: str, port: int, grpc_port: int, prefer_grpc: bool, timeout: int, is_async: bool = False):
+    key = (host, port, grpc_port, prefer_grpc, timeout, is_async)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            cls = AsyncQdrantClient if is_async else QdrantClient
+            client = cls(host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc,
+                         timeout=timeout, api_key=QDRANT_API_KEY, **_client_kwargs(prefer_grpc))
+            _CLIENTS[key] = client
+        return client
+
+def get_embedded_client(path: str) -> QdrantClient:
+    # Embedded mode locks its storage directory, so there must be exactly one client per path
+    key = ("embedded", os.path.abspath(path))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = QdrantClient(path=path)
+            _CLIENTS[key] = client
+        return client
+
+def get_qdrant_handler() -> "QdrantHandler":
+    """Returns the process-wide QdrantHandler (created on first call)."""
+    global _HANDLER
+    with _HANDLER_LOCK:
+        if _HANDLER is None:
+            _HANDLER = QdrantHandler()
+        return _HANDLER
 
 class QdrantHandler:
-    def __init__(self, host="localhost", port=6333):
-        self.client = QdrantClient(host=host, port=port)
+    def __init__(self, host=None, port=None, grpc_port=None, prefer_grpc=None, timeout=None,
+                 backend: Optional[str] = None, collection_backends: Optional[Dict[str, str]] = None):
+        self.host = host or QDRANT_HOST
+        self.port = port or QDRANT_PORT
+        self.grpc_port = grpc_port or QDRANT_GRPC_PORT
+        self.prefer_grpc = QDRANT_PREFER_GRPC if prefer_grpc is None else prefer_grpc
+        self.timeout = timeout or QDRANT_TIMEOUT
+        self.retries = QDRANT_RETRIES
+        self.backoff = QDRANT_RETRY_BACKOFF
+
+        # Backend selection (per collection), instantiated lazily so e.g. a numpy-only
+        # setup never touches the network
+        self.default_backend = backend or VECTOR_BACKEND
+        self.collection_backends = dict(VECTOR_BACKENDS if collection_backends is None else collection_backends)
+        self._backends: Dict[str, VectorBackend] = {}
+        self._backends_lock = threading.Lock()
+        # Quantization / on-disk / HNSW settings per collection
+        self.collection_configs: Dict[str, CollectionConfig] = load_collection_configs()
+        # Called with (collection_name, point_ids) after points are upserted/deleted (cache invalidation)
+        self._upsert_listeners: List[Callable[[str, List[str]], None]] = []
         
         # Specialized Collections
         self.COL_FACTS = "medical_facts"
@@ -17,6 +130,63 @@ class QdrantHandler:
         self.TEXT_DIM = 384
         self.IMAGE_DIM = 512
 
+    @property
+    def client(self) -> QdrantClient:
+        # Remote server client (shared through the registry)
+        return get_client(self.host, self.port, self.grpc_port, self.prefer_grpc, self.timeout)
+
+    @property
+    def aclient(self) -> AsyncQdrantClient:
+        # Async client for the API so Qdrant round trips don't block the event loop (created on first use)
+        return get_client(self.host, self.port, self.grpc_port, self.prefer_grpc, self.timeout, is_async=True)
+
+    def _make_backend(self, kind: str) -> VectorBackend:
+        if kind == "remote":
+            return QdrantBackend(self.client, lambda: self.aclient, self.retries, self.backoff, TRANSIENT_ERRORS, kind="remote")
+        if kind == "embedded":
+            return QdrantBackend(get_embedded_client(QDRANT_PATH), None, kind="embedded")
+        if kind == "numpy":
+            return NumpyBackend(NUMPY_PATH, NUMPY_SAVE_DELAY)
+        raise ValueError(f"Unknown vector backend '{kind}' (expected remote, embedded or numpy)")
+
+    def backend_for(self, collection_name: str) -> VectorBackend:
+        kind = self.collection_backends.get(collection_name, self.default_backend)
+        backend = self._backends.get(kind)
+        if backend is None:
+            with self._backends_lock:
+                backend = self._backends.get(kind)
+                if backend is None:
+                    backend = self._make_backend(kind)
+                    self._backends[kind] = backend
+        return backend
+
+    def reset_connections(self):
+        # Drops backends holding Qdrant clients; they are rebuilt on next use
+        self._backends_lock = threading.Lock()
+        self._backends = {kind: backend for kind, backend in self._backends.items() if kind == "numpy"}
+
+    def backend_kinds(self) -> set:
+        names = (self.COL_FACTS, self.COL_MISINFO, self.COL_IMAGES, self.COL_MEMORY)
+        return {self.collection_backends.get(name, self.default_backend) for name in names}
+
+    def add_upsert_listener(self, listener: Callable[[str, List[str]], None]):
+        self._upsert_listeners.append(listener)
+
+    def _notify(self, collection_name: str, point_ids: List[Any]):
+        ids = [str(pid) for pid in point_ids]
+        for listener in self._upsert_listeners:
+            try:
+                listener(collection_name, ids)
+            except Exception as e:
+                print(f"[Qdrant] Upsert listener failed: {e}")
+
+    def config_for(self, collection_name: str) -> CollectionConfig:
+        return self.collection_configs.get(collection_name) or CollectionConfig()
+
+    def apply_collection_config(self, collection_name: str):
+        """Migrates an existing collection to its configured quantization/on-disk/HNSW settings."""
+        self.backend_for(collection_name).update_collection(collection_name, self.config_for(collection_name))
+
     def init_collections(self):
         self._create_collection_if_not_exists(self.COL_FACTS, self.TEXT_DIM)
         self._create_collection_if_not_exists(self.COL_MISINFO, self.TEXT_DIM)
@@ -24,52 +194,121 @@ class QdrantHandler:
         self._create_collection_if_not_exists(self.COL_MEMORY, self.TEXT_DIM)
 
     def _create_collection_if_not_exists(self, name: str, vector_size: int):
-        if not self.client.collection_exists(name):
-            self.client.create_collection(
-                collection_name=name,
-                vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE)
+        backend = self.backend_for(name)
+        if not backend.collection_exists(name):
+            backend.create_collection(name, vector_size, self.config_for(name))
+            print(f"Created collection: {name} ({backend.kind})")
+        # Also run for existing collections so indexes added later get built
+        backend.create_payload_indexes(name, PAYLOAD_INDEXES.get(name, {}))
+
+    def upsert_points(self, collection_name: str, points: List[models.PointStruct], wait: bool = True):
+        # wait=False returns as soon as the server has queued the write (bulk ingestion)
+        with span(f"qdrant.upsert.{collection_name}", points=len(points)):
+            self.backend_for(collection_name).upsert(collection_name, points, wait)
+        self._notify(collection_name, [p.id for p in points])
+
+    def _build_filter(self, filters: Optional[Dict]) -> Optional[models.Filter]:
+        """
+        Translates {field: value} into a Qdrant Filter (all conditions must hold):
+        - scalar -> exact match, list -> match any (empty lists and None are ignored)
+        - {"gte"/"gt"/"lte"/"lt": ...} -> range; string/date bounds make it a datetime range
+        - a models.Filter is passed through unchanged
+        """
+        if isinstance(filters, models.Filter):
+            return filters
+        if not filters:
+            return None
+        conditions = []
+        for key, val in filters.items():
+            if val is None or val == [] or val == {}:
+                continue
+            if isinstance(val, (list, tuple, set)):
+                conditions.append(models.FieldCondition(key=key, match=models.MatchAny(any=list(val))))
+            elif isinstance(val, dict):
+                bounds = {op: v for op, v in val.items() if op in ("gt", "gte", "lt", "lte") and v is not None}
+                if any(not isinstance(v, (int, float)) for v in bounds.values()):
+                    conditions.append(models.FieldCondition(key=key, range=models.DatetimeRange(**bounds)))
+                else:
+                    conditions.append(models.FieldCondition(key=key, range=models.Range(**bounds)))
+            else:
+                conditions.append(models.FieldCondition(key=key, match=models.MatchValue(value=val)))
+        if conditions:
+            return models.Filter(must=conditions)
+        return None
+
+    def search(self, collection_name: str, query_vector: List[float], top_k=5, filters: Optional[Dict] = None,
+               timeout: Optional[int] = None) -> List[models.ScoredPoint]:
+        with span(f"qdrant.search.{collection_name}", top_k=top_k):
+            return self.backend_for(collection_name).query(
+                collection_name, query_vector, top_k, self._build_filter(filters), timeout or self.timeout,
+                self.config_for(collection_name).search_params()
+            )
+
+    def search_batch(self, collection_name: str, query_vectors: List[List[float]], top_k=5, filters: Optional[Dict] = None,
+                     timeout: Optional[int] = None) -> List[List[models.ScoredPoint]]:
+        if not query_vectors:
+            return []
+        with span(f"qdrant.search_batch.{collection_name}", queries=len(query_vectors), top_k=top_k):
+            return self.backend_for(collection_name).query_batch(
+                collection_name, query_vectors, top_k, self._build_filter(filters), timeout or self.timeout,
+                self.config_for(collection_name).search_params()
             )
-            print(f"Created collection: {name}")
-
-    def upsert_points(self, collection_name: str, points: List[models.PointStruct]):
-        self.client.upsert(
-            collection_name=collection_name,
-            points=points
-        )
-
-    def search(self, collection_name: str, query_vector: List[float], top_k=5, filters: Optional[Dict] = None) -> List[models.ScoredPoint]:
-        query_filter = None
-        if filters:
-            conditions = []
-            for key, val in filters.items():
-                if val is not None:
-                     conditions.append(models.FieldCondition(key=key, match=models.MatchValue(value=val)))
-            if conditions:
-                query_filter = models.Filter(must=conditions)
-
-        # Use query_points instead of search (which is missing in this client version/build)
-        response = self.client.query_points(
-            collection_name=collection_name,
-            query=query_vector,
-            query_filter=query_filter,
-            limit=top_k
-        )
-        # response is a QueryResponse, which should have a 'points' attribute
-        # If response is just a list (in some versions), we handle that too
-        if hasattr(response, 'points'):
-            return response.points
-        return response
 
     def delete_point(self, collection_name: str, point_id: str):
-        self.client.delete(
-            collection_name=collection_name,
-            points_selector=models.PointIdsList(points=[point_id])
-        )
+        self.backend_for(collection_name).delete(collection_name, [point_id])
+        self._notify(collection_name, [point_id])
+
+    def delete_points(self, collection_name: str, point_ids: List[str]):
+        if point_ids:
+            self.backend_for(collection_name).delete(collection_name, list(point_ids))
+            self._notify(collection_name, list(point_ids))
 
     def update_payload(self, collection_name: str, payload: Dict[str, Any], point_id: str):
-        self.client.set_payload(
-            collection_name=collection_name,
-            payload=payload,
-            points=[point_id]
-        )
+        self.backend_for(collection_name).set_payload(collection_name, payload, [point_id])
+
+    def get_payloads(self, collection_name: str, point_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        # Bulk lookup of (a subset of) payload fields, e.g. content hashes for incremental ingestion
+        if not point_ids:
+            return {}
+        return self.backend_for(collection_name).retrieve(collection_name, list(point_ids), fields)
+
+    def list_ids(self, collection_name: str, filters: Optional[Dict] = None) -> List[str]:
+        return self.backend_for(collection_name).scroll_ids(collection_name, self._build_filter(filters))
+
+    # --- Async variants (used by the API request path) ---
+    async def aupsert_points(self, collection_name: str, points: List[models.PointStruct], wait: bool = True):
+        with span(f"qdrant.upsert.{collection_name}", points=len(points)):
+            await self.backend_for(collection_name).aupsert(collection_name, points, wait)
+        self._notify(collection_name, [p.id for p in points])
+
+    async def asearch(self, collection_name: str, query_vector: List[float], top_k=5, filters: Optional[Dict] = None,
+                      timeout: Optional[int] = None) -> List[models.ScoredPoint]:
+        with span(f"qdrant.search.{collection_name}", top_k=top_k):
+            return await self.backend_for(collection_name).aquery(
+                collection_name, query_vector, top_k, self._build_filter(filters), timeout or self.timeout,
+                self.config_for(collection_name).search_params()
+            )
+
+    async def asearch_batch(self, collection_name: str, query_vectors: List[List[float]], top_k=5,
+                            filters: Optional[Dict] = None, timeout: Optional[int] = None) -> List[List[models.ScoredPoint]]:
+        # One round trip (query_batch_points) for every vector; results in input order
+        if not query_vectors:
+            return []
+        with span(f"qdrant.search_batch.{collection_name}", queries=len(query_vectors), top_k=top_k):
+            return await self.backend_for(collection_name).aquery_batch(
+                collection_name, query_vectors, top_k, self._build_filter(filters), timeout or self.timeout,
+                self.config_for(collection_name).search_params()
+            )
+
+    async def adelete_point(self, collection_name: str, point_id: str):
+        with span(f"qdrant.delete.{collection_name}"):
+            await self.backend_for(collection_name).adelete(collection_name, [point_id])
+        self._notify(collection_name, [point_id])
+
+    async def aupdate_payload(self, collection_name: str, payload: Dict[str, Any], point_id: str):
+        await self.backend_for(collection_name).aset_payload(collection_name, payload, [point_id])
 
+    async def abatch_set_payloads(self, collection_name: str, updates: Dict[str, Dict[str, Any]], wait: bool = False):
+        # Many per-point payload patches in one round trip
+        with span(f"qdrant.set_payloads.{collection_name}", points=len(updates)):
+            await self.backend_for(collection_name).abatch_set_payloads(collection_name, updates, wait)
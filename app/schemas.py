@@ -8,6 +8,14 @@ class SearchFilters(BaseModel):
     content_type: Optional[Literal["text", "image", "all"]] = "all"
     min_date: Optional[str] = None
 
+    def payload_filters(self) -> Dict[str, Any]:
+        # In QdrantHandler filter form (content_type picks collections instead)
+        return {
+            "topic": self.topics,
+            "source": self.source,
+            "date": {"gte": self.min_date} if self.min_date else None,
+        }
+
 # --- Ingestion Models ---
 class TextDoc(BaseModel):
     doc_id: str
@@ -39,6 +47,12 @@ class SearchRequest(BaseModel):
     top_k: int = 5
     filters: Optional[SearchFilters] = None
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    type: Literal["text", "image", "all"] = "all"
+    top_k: int = 5
+    filters: Optional[SearchFilters] = None
+
 class SearchResultItem(BaseModel):
     id: str
     score: float
@@ -51,6 +65,9 @@ class SearchResultItem(BaseModel):
 class SearchResponse(BaseModel):
     results: List[SearchResultItem]
 
+class BatchSearchResponse(BaseModel):
+    results: List[SearchResponse] # Same order as the queries
+
 class AgentQueryRequest(BaseModel):
     query: str
     user_id: str
@@ -63,6 +80,19 @@ class AgentResponse(BaseModel):
     evidence: List[SearchResultItem]
     recommendations: List[str]
     memory_actions: List[str]
+    # How final_answer was produced: "template" (decisive verdict, no LLM call), "cached" (earlier
+    # LLM answer), "llm" (generated for this request) or "fallback" (LLM unavailable/failed)
+    answer_tier: Literal["template", "cached", "llm", "fallback"] = "llm"
+
+class BatchAgentQueryRequest(BaseModel):
+    queries: List[str]
+    user_id: str
+    session_id: str
+    include_llm: bool = False # Off: final_answer is the rule-based answer
+    include_memory: bool = False # Off: claims are not stored in user memory
+
+class BatchAgentResponse(BaseModel):
+    results: List[AgentResponse] # Same order as the queries
 
 # --- Memory Models ---
 class MemoryItem(BaseModel):
@@ -74,6 +104,7 @@ class MemoryItem(BaseModel):
     decay_weight: float = 1.0
     access_count: int = 1
     last_accessed: float = 0.0 # Timestamp
+    score: Optional[float] = None # Retrieval rank: similarity x time-decayed weight
 
 class MemoryUpdateRequest(BaseModel):
     item: MemoryItem
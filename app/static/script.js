@@ -73,6 +73,33 @@ function appendMessage(text, type, data = null) {
     chatHistory.scrollTop = chatHistory.scrollHeight;
 }
 
+// Parses a Server-Sent Events stream from fetch() and calls onEvent(event, data) per message
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let dataLines = [];
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    }
+}
+
 async function sendMessage() {
     const text = userInput.value.trim();
     if (!text) return;
@@ -89,7 +116,7 @@ async function sendMessage() {
     chatHistory.appendChild(loadingDiv);
 
     try {
-        const response = await fetch(`${API_URL}/agent/query`, {
+        const response = await fetch(`${API_URL}/agent/query/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -98,13 +125,30 @@ async function sendMessage() {
                 query: text
             })
         });
-
-        const data = await response.json();
-        document.getElementById(loadingId).remove();
-        appendMessage(data.final_answer, 'agent', data);
+        if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+        // Verdict + evidence render as soon as they arrive; the answer text fills in token by token
+        let answerDiv = null;
+        let answer = '';
+        await readEventStream(response, (event, data) => {
+            if (event === 'verdict') {
+                document.getElementById(loadingId)?.remove();
+                appendMessage('', 'agent', data);
+                answerDiv = chatHistory.lastElementChild.querySelector('.msg-content');
+                answerDiv.innerHTML = '<em>Writing answer...</em>';
+            } else if (event === 'token' && answerDiv) {
+                answer += data.text;
+                answerDiv.innerHTML = answer.replace(/\n/g, '<br>');
+                chatHistory.scrollTop = chatHistory.scrollHeight;
+            } else if (event === 'done' && answerDiv) {
+                answerDiv.innerHTML = data.final_answer.replace(/\n/g, '<br>');
+            } else if (event === 'error') {
+                throw new Error(data.detail);
+            }
+        });
 
     } catch (error) {
-        document.getElementById(loadingId).remove();
+        document.getElementById(loadingId)?.remove();
         appendMessage("⚠️ Connection Error. Ensure the backend API is running.", 'agent');
         console.error(error);
     }
@@ -0,0 +1,628 @@
+import asyncio
+import atexit
+import contextlib
+import datetime as dt
+import json
+import os
+import threading
+import time
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.http import models
+from app.collection_config import CollectionConfig, payload_schema
+from typing import Any, Callable, Dict, List, Optional
+
+
+class VectorBackend:
+    """
+    Storage/search engine behind QdrantHandler. One backend instance can serve several collections.
+    Async methods default to running the sync ones in a worker thread; backends with a native
+    async client (or no I/O at all) override them.
+    """
+    kind = "base"
+
+    def collection_exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def create_collection(self, name: str, vector_size: int, config: Optional[CollectionConfig] = None):
+        raise NotImplementedError
+
+    def update_collection(self, name: str, config: CollectionConfig):
+        """Applies storage/index settings to an existing collection (no-op where not applicable)."""
+        pass
+
+    def create_payload_indexes(self, name: str, indexes: Dict[str, str]):
+        """Creates the missing payload indexes ({field: kind}, see collection_config.PAYLOAD_INDEXES)."""
+        pass
+
+    def upsert(self, name: str, points: List[models.PointStruct], wait: bool = True):
+        raise NotImplementedError
+
+    def query(self, name: str, vector: List[float], limit: int, query_filter: Optional[models.Filter] = None,
+              timeout: Optional[int] = None, search_params: Optional[models.SearchParams] = None) -> List[models.ScoredPoint]:
+        raise NotImplementedError
+
+    def query_batch(self, name: str, vectors: List[List[float]], limit: int, query_filter: Optional[models.Filter] = None,
+                    timeout: Optional[int] = None, search_params: Optional[models.SearchParams] = None) -> List[List[models.ScoredPoint]]:
+        """One result list per vector (same limit/filter for all)."""
+        return [self.query(name, v, limit, query_filter, timeout, search_params) for v in vectors]
+
+    def delete(self, name: str, point_ids: List[Any]):
+        raise NotImplementedError
+
+    def retrieve(self, name: str, point_ids: List[Any], payload_fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Returns {point_id: payload} for the ids that exist (payload limited to `payload_fields`)."""
+        raise NotImplementedError
+
+    def scroll_ids(self, name: str, query_filter: Optional[models.Filter] = None) -> List[str]:
+        """Returns the ids of every point matching `query_filter`."""
+        raise NotImplementedError
+
+    def set_payload(self, name: str, payload: Dict[str, Any], point_ids: List[Any]):
+        raise NotImplementedError
+
+    def batch_set_payloads(self, name: str, updates: Dict[Any, Dict[str, Any]], wait: bool = False):
+        for point_id, payload in updates.items():
+            self.set_payload(name, payload, [point_id])
+
+    async def aupsert(self, name, points, wait=True):
+        return await asyncio.to_thread(self.upsert, name, points, wait)
+
+    async def aquery(self, name, vector, limit, query_filter=None, timeout=None, search_params=None):
+        return await asyncio.to_thread(self.query, name, vector, limit, query_filter, timeout, search_params)
+
+    async def aquery_batch(self, name, vectors, limit, query_filter=None, timeout=None, search_params=None):
+        return await asyncio.to_thread(self.query_batch, name, vectors, limit, query_filter, timeout, search_params)
+
+    async def adelete(self, name, point_ids):
+        return await asyncio.to_thread(self.delete, name, point_ids)
+
+    async def aset_payload(self, name, payload, point_ids):
+        return await asyncio.to_thread(self.set_payload, name, payload, point_ids)
+
+    async def abatch_set_payloads(self, name, updates, wait=False):
+        return await asyncio.to_thread(self.batch_set_payloads, name, updates, wait)
+
+
+# Embedded (local) Qdrant is not thread-safe (one SQLite connection): calls on the same client are serialized
+_EMBEDDED_LOCKS: Dict[int, threading.Lock] = {}
+_EMBEDDED_LOCKS_GUARD = threading.Lock()
+
+def _embedded_lock(client) -> threading.Lock:
+    with _EMBEDDED_LOCKS_GUARD:
+        return _EMBEDDED_LOCKS.setdefault(id(client), threading.Lock())
+
+class QdrantBackend(VectorBackend):
+    """
+    Qdrant via qdrant-client: either a remote server (sync + async clients) or embedded
+    mode (QdrantClient(path=...), no async client so async calls run in a thread).
+    Transient transport errors are retried with exponential backoff.
+    """
+
+    def __init__(self, client: QdrantClient, aclient_factory: Optional[Callable[[], AsyncQdrantClient]] = None,
+                 retries: int = 0, backoff: float = 0.2, transient_errors: tuple = (), kind: str = "remote"):
+        self.client = client
+        self._aclient_factory = aclient_factory
+        self.retries = retries
+        self.backoff = backoff
+        self.transient_errors = transient_errors or (ConnectionError, TimeoutError)
+        self.kind = kind
+        self._lock = _embedded_lock(client) if kind == "embedded" else contextlib.nullcontext()
+
+    @property
+    def aclient(self) -> Optional[AsyncQdrantClient]:
+        return self._aclient_factory() if self._aclient_factory else None
+
+    # --- Retries with exponential backoff ---
+    def _call(self, fn, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                with self._lock:
+                    return fn(*args, **kwargs)
+            except self.transient_errors as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                print(f"[Qdrant] {fn.__name__} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    async def _acall(self, fn, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                return await fn(*args, **kwargs)
+            except self.transient_errors as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                print(f"[Qdrant] {fn.__name__} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _points(response) -> List[models.ScoredPoint]:
+        # response is a QueryResponse, which should have a 'points' attribute
+        # If response is just a list (in some versions), we handle that too
+        if hasattr(response, 'points'):
+            return response.points
+        return response
+
+    @staticmethod
+    def _set_payload_ops(updates: Dict[Any, Dict[str, Any]]):
+        return [
+            models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in updates.items()
+        ]
+
+    def collection_exists(self, name: str) -> bool:
+        return self._call(self.client.collection_exists, name)
+
+    def create_collection(self, name: str, vector_size: int, config: Optional[CollectionConfig] = None):
+        config = config or CollectionConfig()
+        self._call(
+            self.client.create_collection,
+            collection_name=name,
+            vectors_config=config.vectors_config(vector_size),
+            quantization_config=config.quantization_config(),
+            hnsw_config=config.hnsw_config(),
+            on_disk_payload=config.on_disk_payload or None
+        )
+
+    def update_collection(self, name: str, config: CollectionConfig):
+        quantization = config.quantization_config()
+        self._call(
+            self.client.update_collection,
+            collection_name=name,
+            vectors_config={"": models.VectorParamsDiff(on_disk=config.on_disk)},
+            collection_params=models.CollectionParamsDiff(on_disk_payload=config.on_disk_payload),
+            hnsw_config=config.hnsw_config(),
+            # Disabled explicitly so removing quantization from the config also removes it here
+            quantization_config=quantization if quantization is not None else models.Disabled.DISABLED
+        )
+
+    def create_payload_indexes(self, name, indexes):
+        if self.kind != "remote":
+            # Local mode scans payloads anyway and only warns about indexes
+            return
+        existing = self._call(self.client.get_collection, collection_name=name).payload_schema or {}
+        for field, kind in indexes.items():
+            if field not in existing:
+                self._call(
+                    self.client.create_payload_index,
+                    collection_name=name,
+                    field_name=field,
+                    field_schema=payload_schema(kind),
+                    wait=True
+                )
+                print(f"Created payload index: {name}.{field} ({kind})")
+
+    def upsert(self, name, points, wait=True):
+        self._call(self.client.upsert, collection_name=name, points=points, wait=wait)
+
+    def query(self, name, vector, limit, query_filter=None, timeout=None, search_params=None):
+        # Use query_points instead of search (which is missing in this client version/build)
+        kwargs = {"timeout": timeout} if timeout and self.kind == "remote" else {}
+        if self.kind != "remote":
+            # Local mode is always exact brute force: HNSW/quantization params don't apply
+            search_params = None
+        response = self._call(
+            self.client.query_points,
+            collection_name=name,
+            query=vector,
+            query_filter=query_filter,
+            search_params=search_params,
+            limit=limit,
+            **kwargs
+        )
+        return self._points(response)
+
+    def _query_requests(self, vectors, limit, query_filter, search_params) -> List[models.QueryRequest]:
+        return [
+            models.QueryRequest(query=v, filter=query_filter, params=search_params, limit=limit, with_payload=True)
+            for v in vectors
+        ]
+
+    def query_batch(self, name, vectors, limit, query_filter=None, timeout=None, search_params=None):
+        # All vectors in a single request/round trip
+        kwargs = {"timeout": timeout} if timeout and self.kind == "remote" else {}
+        if self.kind != "remote":
+            search_params = None
+        responses = self._call(
+            self.client.query_batch_points,
+            collection_name=name,
+            requests=self._query_requests(vectors, limit, query_filter, search_params),
+            **kwargs
+        )
+        return [self._points(r) for r in responses]
+
+    def delete(self, name, point_ids):
+        self._call(self.client.delete, collection_name=name, points_selector=models.PointIdsList(points=point_ids))
+
+    def retrieve(self, name, point_ids, payload_fields=None):
+        records = self._call(
+            self.client.retrieve,
+            collection_name=name,
+            ids=point_ids,
+            with_payload=payload_fields if payload_fields is not None else True,
+            with_vectors=False
+        )
+        return {str(r.id): r.payload or {} for r in records}
+
+    def scroll_ids(self, name, query_filter=None):
+        ids, offset = [], None
+        while True:
+            records, offset = self._call(
+                self.client.scroll,
+                collection_name=name,
+                scroll_filter=query_filter,
+                limit=1000,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            ids.extend(str(r.id) for r in records)
+            if offset is None:
+                return ids
+
+    def set_payload(self, name, payload, point_ids):
+        self._call(self.client.set_payload, collection_name=name, payload=payload, points=point_ids)
+
+    def batch_set_payloads(self, name, updates, wait=False):
+        operations = self._set_payload_ops(updates)
+        if operations:
+            self._call(self.client.batch_update_points, collection_name=name, update_operations=operations, wait=wait)
+
+    # --- Native async (remote server only) ---
+    async def aupsert(self, name, points, wait=True):
+        if self.aclient is None:
+            return await super().aupsert(name, points, wait)
+        await self._acall(self.aclient.upsert, collection_name=name, points=points, wait=wait)
+
+    async def aquery(self, name, vector, limit, query_filter=None, timeout=None, search_params=None):
+        if self.aclient is None:
+            return await super().aquery(name, vector, limit, query_filter, timeout, search_params)
+        response = await self._acall(
+            self.aclient.query_points,
+            collection_name=name,
+            query=vector,
+            query_filter=query_filter,
+            search_params=search_params,
+            limit=limit,
+            timeout=timeout
+        )
+        return self._points(response)
+
+    async def aquery_batch(self, name, vectors, limit, query_filter=None, timeout=None, search_params=None):
+        if self.aclient is None:
+            return await super().aquery_batch(name, vectors, limit, query_filter, timeout, search_params)
+        responses = await self._acall(
+            self.aclient.query_batch_points,
+            collection_name=name,
+            requests=self._query_requests(vectors, limit, query_filter, search_params),
+            timeout=timeout
+        )
+        return [self._points(r) for r in responses]
+
+    async def adelete(self, name, point_ids):
+        if self.aclient is None:
+            return await super().adelete(name, point_ids)
+        await self._acall(self.aclient.delete, collection_name=name, points_selector=models.PointIdsList(points=point_ids))
+
+    async def aset_payload(self, name, payload, point_ids):
+        if self.aclient is None:
+            return await super().aset_payload(name, payload, point_ids)
+        await self._acall(self.aclient.set_payload, collection_name=name, payload=payload, points=point_ids)
+
+    async def abatch_set_payloads(self, name, updates, wait=False):
+        if self.aclient is None:
+            return await super().abatch_set_payloads(name, updates, wait)
+        operations = self._set_payload_ops(updates)
+        if operations:
+            await self._acall(self.aclient.batch_update_points, collection_name=name, update_operations=operations, wait=wait)
+
+
+def _match_condition(payload: Dict[str, Any], condition) -> bool:
+    if isinstance(condition, models.Filter):
+        return matches_filter(payload, condition)
+    if isinstance(condition, models.HasIdCondition):
+        return False
+    value = payload.get(condition.key)
+    # Like Qdrant, a list payload matches when any of its elements does
+    values = value if isinstance(value, list) else [value]
+    match = condition.match
+    if isinstance(match, models.MatchValue):
+        return match.value in values
+    if isinstance(match, models.MatchAny):
+        return any(v in match.any for v in values)
+    if isinstance(match, models.MatchExcept):
+        return not any(v in match.except_ for v in values)
+    if isinstance(condition.range, models.DatetimeRange):
+        return any(_in_range(_as_datetime(v), condition.range, _as_datetime) for v in values)
+    if isinstance(condition.range, models.Range):
+        return any(isinstance(v, (int, float)) and _in_range(v, condition.range, float) for v in values)
+    raise NotImplementedError(f"NumpyBackend does not support condition {condition!r}")
+
+def _as_datetime(value) -> Optional[dt.datetime]:
+    # Naive values are taken as UTC, matching Qdrant's datetime index
+    if isinstance(value, str):
+        try:
+            value = dt.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, dt.date) and not isinstance(value, dt.datetime):
+        value = dt.datetime(value.year, value.month, value.day)
+    if not isinstance(value, dt.datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=dt.timezone.utc)
+
+def _in_range(value, bounds, convert) -> bool:
+    if value is None:
+        return False
+    return ((bounds.gt is None or value > convert(bounds.gt)) and
+            (bounds.gte is None or value >= convert(bounds.gte)) and
+            (bounds.lt is None or value < convert(bounds.lt)) and
+            (bounds.lte is None or value <= convert(bounds.lte)))
+
+def matches_filter(payload: Dict[str, Any], query_filter: Optional[models.Filter]) -> bool:
+    """Evaluates a Qdrant Filter against a payload dict (subset used by this app)."""
+    if query_filter is None:
+        return True
+    must = query_filter.must or []
+    should = query_filter.should or []
+    must_not = query_filter.must_not or []
+    must = must if isinstance(must, list) else [must]
+    should = should if isinstance(should, list) else [should]
+    must_not = must_not if isinstance(must_not, list) else [must_not]
+    if not all(_match_condition(payload, c) for c in must):
+        return False
+    if should and not any(_match_condition(payload, c) for c in should):
+        return False
+    return not any(_match_condition(payload, c) for c in must_not)
+
+
+def _key(point_id: Any) -> Any:
+    # Qdrant ids are unsigned ints or UUID strings; normalise UUID objects to str
+    return point_id if isinstance(point_id, int) else str(point_id)
+
+
+# NumpyBackend: reads of a collection being rewritten by another process wait and retry this many times
+NUMPY_LOAD_ATTEMPTS = 5
+
+
+class _NumpyCollection:
+    """
+    Immutable snapshot of a collection: writers build a new one and swap it in under the backend
+    lock, so a reader holding a snapshot never sees a half-applied write.
+    """
+    def __init__(self, vector_size: int, ids: Optional[List[Any]] = None, payloads: Optional[List[Dict[str, Any]]] = None,
+                 matrix: Optional[np.ndarray] = None, index: Optional[Dict[Any, int]] = None):
+        self.vector_size = vector_size
+        self.ids: List[Any] = ids if ids is not None else []
+        self.payloads: List[Dict[str, Any]] = payloads if payloads is not None else []
+        self.index: Dict[Any, int] = index if index is not None else {pid: i for i, pid in enumerate(self.ids)}
+        # Rows are L2-normalised so cosine similarity is a single matrix-vector product
+        self.matrix = matrix if matrix is not None else np.zeros((0, vector_size), dtype=np.float32)
+
+
+class NumpyBackend(VectorBackend):
+    """
+    In-process exact (brute-force) cosine search over a NumPy matrix. Meant for small curated
+    collections (medical_facts, medical_misinfo) where a matrix multiply beats any network hop.
+    Collections are persisted to `<path>/<collection>.npy` + `.json` so ingest scripts and the
+    API (separate processes) see the same data; files are reloaded when their mtime changes.
+    Persistence is write-behind: writes are saved at most every `save_delay` seconds (and at
+    exit), and the .npy is only rewritten when vectors changed, not for payload-only updates.
+    """
+    kind = "numpy"
+
+    def __init__(self, path: str, save_delay: float = 0.0):
+        self.path = path
+        self.save_delay = save_delay
+        os.makedirs(path, exist_ok=True)
+        self._collections: Dict[str, _NumpyCollection] = {}
+        # mtime of the metadata file as of our last load/save, per collection
+        self._mtimes: Dict[str, float] = {}
+        # Collections with unsaved writes -> whether their vectors (not just payloads) changed
+        self._dirty: Dict[str, bool] = {}
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        if save_delay > 0:
+            atexit.register(self.flush)
+
+    def _files(self, name: str):
+        base = os.path.join(self.path, name)
+        return base + ".npy", base + ".json"
+
+    def _load(self, name: str) -> Optional[_NumpyCollection]:
+        vec_file, meta_file = self._files(name)
+        with self._lock:
+            col = self._collections.get(name)
+            # Unsaved local writes are newer than whatever is on disk
+            if name in self._dirty or not os.path.exists(meta_file):
+                return col
+            mtime = os.path.getmtime(meta_file)
+            if col is not None and self._mtimes.get(name, 0.0) >= mtime:
+                return col
+            for attempt in range(NUMPY_LOAD_ATTEMPTS):
+                with open(meta_file) as f:
+                    meta = json.load(f)
+                matrix = np.load(vec_file).astype(np.float32) if meta["ids"] else None
+                if matrix is None or matrix.shape[0] == meta.get("rows", len(meta["ids"])):
+                    break
+                # Another process is between its matrix and metadata writes: keep the current
+                # snapshot (mtime not updated, so the next call retries) or wait for the new one
+                if col is not None:
+                    return col
+                time.sleep(0.05 * (attempt + 1))
+            else:
+                raise RuntimeError(f"{vec_file} and {meta_file} disagree on the row count")
+            col = _NumpyCollection(meta["vector_size"], meta["ids"], meta["payloads"], matrix)
+            self._collections[name] = col
+            self._mtimes[name] = mtime
+            return col
+
+    def _save(self, name: str, col: _NumpyCollection, vectors: bool) -> float:
+        vec_file, meta_file = self._files(name)
+        # Both files are replaced atomically, matrix first; the metadata records the row count so a
+        # reader catching the matrix of one save with the metadata of another can tell
+        if vectors:
+            tmp = vec_file + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, col.matrix)
+            os.replace(tmp, vec_file)
+        # Write metadata last: its mtime is what readers watch
+        tmp = meta_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"vector_size": col.vector_size, "rows": len(col.ids), "ids": col.ids, "payloads": col.payloads}, f)
+        os.replace(tmp, meta_file)
+        return os.path.getmtime(meta_file)
+
+    def _commit(self, name: str, col: _NumpyCollection, vectors: bool):
+        # Caller holds self._lock (and calls _persist once it's released): swaps the new snapshot in
+        self._collections[name] = col
+        self._dirty[name] = self._dirty.get(name, False) or vectors
+
+    def _persist(self):
+        if self.save_delay <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._timer is None or not self._timer.is_alive():
+                self._timer = threading.Timer(self.save_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Persists every collection with unsaved writes (also runs at exit)."""
+        with self._save_lock:
+            with self._lock:
+                self._timer = None
+                snapshots = {name: (self._collections[name], vectors) for name, vectors in self._dirty.items()}
+            # Disk writes happen outside self._lock: queries and new writes aren't blocked by them
+            for name, (col, vectors) in snapshots.items():
+                mtime = self._save(name, col, vectors)
+                with self._lock:
+                    self._mtimes[name] = mtime
+                    # Written again meanwhile: stays dirty for the next flush
+                    if self._collections.get(name) is col:
+                        self._dirty.pop(name, None)
+
+    def _get(self, name: str) -> _NumpyCollection:
+        col = self._load(name)
+        if col is None:
+            raise KeyError(f"Collection {name} not found in NumpyBackend ({self.path})")
+        return col
+
+    def collection_exists(self, name: str) -> bool:
+        return self._load(name) is not None
+
+    def create_collection(self, name: str, vector_size: int, config: Optional[CollectionConfig] = None):
+        # Exact search over an in-RAM matrix: quantization/HNSW settings don't apply
+        with self._lock:
+            self._commit(name, _NumpyCollection(vector_size), vectors=True)
+        # Saved right away so other processes see the collection
+        self.flush()
+
+    def upsert(self, name, points, wait=True):
+        with self._lock:
+            col = self._get(name)
+            ids, payloads, index = list(col.ids), list(col.payloads), dict(col.index)
+            replaced, new_rows = {}, []
+            for p in points:
+                pid = _key(p.id)
+                vec = np.asarray(p.vector, dtype=np.float32)
+                norm = np.linalg.norm(vec)
+                vec = vec / norm if norm > 0 else vec
+                i = index.get(pid)
+                if i is None:
+                    index[pid] = len(ids)
+                    ids.append(pid)
+                    payloads.append(p.payload or {})
+                    new_rows.append(vec)
+                    continue
+                payloads[i] = p.payload or {}
+                if i < len(col.ids):
+                    replaced[i] = vec
+                else:
+                    new_rows[i - len(col.ids)] = vec
+            matrix = col.matrix
+            if replaced:
+                matrix = matrix.copy()
+                for i, vec in replaced.items():
+                    matrix[i] = vec
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            self._commit(name, _NumpyCollection(col.vector_size, ids, payloads, matrix, index), vectors=True)
+        self._persist()
+
+    def query(self, name, vector, limit, query_filter=None, timeout=None, search_params=None):
+        return self.query_batch(name, [vector], limit, query_filter, timeout, search_params)[0]
+
+    def query_batch(self, name, vectors, limit, query_filter=None, timeout=None, search_params=None):
+        # One snapshot for the whole call: ids, payloads and matrix always agree
+        col = self._get(name)
+        if not col.ids:
+            return [[] for _ in vectors]
+        q = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(norms > 0, norms, 1)
+        # (points x queries): one matrix product for the whole batch
+        scores = col.matrix @ q.T
+        if query_filter is not None:
+            mask = np.fromiter((matches_filter(p, query_filter) for p in col.payloads), dtype=bool, count=len(col.payloads))
+            scores = np.where(mask[:, None], scores, -np.inf)
+        k = min(limit, len(col.ids))
+        results = []
+        for j in range(scores.shape[1]):
+            column = scores[:, j]
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            results.append([
+                models.ScoredPoint(id=col.ids[i], version=0, score=float(column[i]), payload=col.payloads[i])
+                for i in top if np.isfinite(column[i])
+            ])
+        return results
+
+    def delete(self, name, point_ids):
+        with self._lock:
+            col = self._get(name)
+            drop = {col.index[pid] for pid in map(_key, point_ids) if pid in col.index}
+            if not drop:
+                return
+            keep = [i for i in range(len(col.ids)) if i not in drop]
+            self._commit(name, _NumpyCollection(
+                col.vector_size, [col.ids[i] for i in keep], [col.payloads[i] for i in keep], col.matrix[keep]
+            ), vectors=True)
+        self._persist()
+
+    def retrieve(self, name, point_ids, payload_fields=None):
+        col = self._get(name)
+        found = {}
+        for pid in point_ids:
+            i = col.index.get(_key(pid))
+            if i is not None:
+                payload = col.payloads[i]
+                if payload_fields is not None:
+                    payload = {k: payload[k] for k in payload_fields if k in payload}
+                found[str(pid)] = payload
+        return found
+
+    def scroll_ids(self, name, query_filter=None):
+        col = self._get(name)
+        return [str(pid) for pid, payload in zip(col.ids, col.payloads) if matches_filter(payload, query_filter)]
+
+    def set_payload(self, name, payload, point_ids):
+        self.batch_set_payloads(name, {pid: payload for pid in point_ids})
+
+    def batch_set_payloads(self, name, updates, wait=False):
+        with self._lock:
+            col = self._get(name)
+            payloads = list(col.payloads)
+            for pid, payload in updates.items():
+                i = col.index.get(_key(pid))
+                if i is not None:
+                    payloads[i] = {**payloads[i], **payload}
+            # Vectors are untouched: the matrix is shared and the .npy isn't rewritten
+            self._commit(name, _NumpyCollection(col.vector_size, col.ids, payloads, col.matrix, col.index), vectors=False)
+        self._persist()
+
+    # Async calls use the base class thread hop: _load stats (and may reload) the files on disk
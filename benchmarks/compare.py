@@ -0,0 +1,47 @@
+import argparse
+import json
+import sys
+
+# Compares two benchmarks/run.py result files, e.g. main vs. a branch:
+#   python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json --threshold 0.1
+# Exits with status 1 when any p95 latency got worse (or ingest throughput dropped) by more than the threshold.
+
+def _rows(report):
+    for section in ("stages", "api"):
+        for name, stats in report.get(section, {}).items():
+            if stats.get("n"):
+                yield f"{section}.{name}", "p95_ms", stats["p95_ms"], False
+    for name, stats in report.get("ingest", {}).items():
+        yield f"ingest.{name}", "records_per_s", stats["records_per_s"], True
+
+def compare(base, new, threshold: float) -> bool:
+    base_rows = {(name, metric): (value, higher_is_better) for name, metric, value, higher_is_better in _rows(base)}
+    regressed = False
+    print(f"{'metric':<45} {'base':>10} {'new':>10} {'change':>8}")
+    for name, metric, value, higher_is_better in _rows(new):
+        if (name, metric) not in base_rows:
+            continue
+        old, _ = base_rows[(name, metric)]
+        change = (value - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            flag = "  ⚠️ regression"
+            regressed = True
+        print(f"{name + ' ' + metric:<45} {old:>10.2f} {value:>10.2f} {change:>+8.1%}{flag}")
+    for label, report in (("base", base), ("new", new)):
+        memory = report.get("memory", {}).get("after_api", {})
+        print(f"{label} peak RSS: {memory.get('peak_rss_mb')} MB  (commit {report.get('meta', {}).get('commit')})")
+    return regressed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    sys.exit(1 if compare(base, new, args.threshold) else 0)
@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+import numpy as np
+
+# End-to-end benchmark for the query and ingest hot paths. Everything runs in-process against a
+# throwaway vector store (embedded Qdrant or numpy in a temp dir) and a local LLM stub, and the
+# results are written as JSON so runs can be compared across commits (benchmarks/compare.py).
+#
+#   python -m benchmarks.run --scale 1k
+#   python -m benchmarks.run --scale 100k --backend numpy --queries 500
+#   python -m benchmarks.run --scale 1k --encoder hash     # pipeline/DB cost without the models
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BENCH_USER = "bench_user"
+
+# --- Measurements ---
+def summarize(samples: List[float], wall_seconds: float = None) -> Dict[str, float]:
+    """Latency percentiles (ms) and throughput. Without wall_seconds the samples ran back to back."""
+    if not samples:
+        return {"n": 0}
+    ms = np.asarray(samples) * 1000
+    wall = wall_seconds if wall_seconds is not None else float(np.sum(samples))
+    return {
+        "n": len(samples),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "throughput_per_s": round(len(samples) / wall, 2) if wall > 0 else None,
+    }
+
+def rss_mb() -> Dict[str, float]:
+    current = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return {"rss_mb": current, "peak_rss_mb": round(peak_mb, 1)}
+
+async def timed(samples: List[float], coro):
+    start = time.perf_counter()
+    result = await coro
+    samples.append(time.perf_counter() - start)
+    return result
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# --- Environment (must run before any app import) ---
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_llm_stub(delay: float) -> int:
+    import uvicorn
+    from scripts import mock_llm_server
+    mock_llm_server.settings.update(delay=delay, jitter=0.0, fail_rate=0.0, token_delay=0.0)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(mock_llm_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="llm-stub", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+def configure_env(args, workdir: str):
+    os.environ["HEALTHGUARD_VECTOR_BACKEND"] = args.backend
+    os.environ["QDRANT_PATH"] = os.path.join(workdir, "qdrant")
+    os.environ["HEALTHGUARD_NUMPY_PATH"] = os.path.join(workdir, "numpy")
+    os.environ["HEALTHGUARD_ANSWER_POLICY"] = args.answer_policy
+    # Measure the encoder, not the query-embedding cache
+    os.environ.setdefault("HEALTHGUARD_EMBED_CACHE_SIZE", "0")
+    # Write every recall back: with the default interval the freshly seeded memories are never
+    # reinforced and memory_reinforce_flush would time an empty buffer
+    os.environ.setdefault("HEALTHGUARD_REINFORCE_MIN_INTERVAL", "0")
+    port = start_llm_stub(args.llm_delay)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["OPENAI_API_KEY"] = "bench"
+
+def use_hash_encoder():
+    """Replaces the models with a deterministic bag-of-words hash (same dimensions)."""
+    from app.embeddings import EmbeddingModel
+    from app.cache import normalize_text
+
+    def encoder(dim):
+        def encode(self, texts):
+            out = np.zeros((len(texts), dim), dtype=np.float32)
+            for row, text in enumerate(texts):
+                for word in normalize_text(text).split():
+                    out[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+            return out.tolist()
+        return encode
+
+    EmbeddingModel.encode_texts = encoder(384)
+    EmbeddingModel.encode_text = lambda self, text: self.encode_texts([text])[0]
+    EmbeddingModel.encode_texts_for_image_search = encoder(512)
+    EmbeddingModel.encode_text_for_image_search = lambda self, text: self.encode_texts_for_image_search([text])[0]
+
+# --- Workload ---
+def sample_queries(files: List[str], count: int, seed: int) -> List[str]:
+    """Claims resembling the corpus (reservoir-sampled bodies, reworded) plus unrelated ones."""
+    rng = random.Random(seed)
+    reservoir, seen = [], 0
+    for path in files:
+        with open(path) as f:
+            for line in f:
+                seen += 1
+                if len(reservoir) < count:
+                    reservoir.append(line)
+                elif rng.random() < count / seen:
+                    reservoir[rng.randrange(count)] = line
+    bodies = [json.loads(line)["body"] for line in reservoir]
+    templates = ["Is it true that {}", "I read that {}", "{}", "Someone told me {}"]
+    queries = [rng.choice(templates).format(body[0].lower() + body[1:]) for body in bodies]
+    unrelated = ["show me a diagram of the heart", "what is the capital of France", "best pizza toppings"]
+    for i in range(0, len(queries), 10):
+        queries[i] = unrelated[(i // 10) % len(unrelated)]
+    return queries[:count]
+
+def bench_ingest(files: Dict[str, tuple], batch_size: int, workers: int) -> Dict[str, Dict]:
+    from scripts import ingest
+    results = {}
+    for name, (path, collection) in files.items():
+        records = sum(1 for _ in open(path))
+        for label, incremental in ((name, False), (f"{name}_reingest_unchanged", True)):
+            start = time.perf_counter()
+            ingest.ingest_file(path, collection, batch_size=batch_size, workers=workers, resume=False, incremental=incremental)
+            seconds = time.perf_counter() - start
+            results[label] = {"records": records, "seconds": round(seconds, 3), "records_per_s": round(records / seconds, 1)}
+    return results
+
+async def seed_memories(agent, count: int):
+    texts = [f"Query: past claim number {i} about health | Verdict: True" for i in range(count)]
+    await asyncio.gather(*(agent.memory.add_memory(BENCH_USER, "bench", t, memory_type="history") for t in texts))
+    await agent.memory.flush()
+
+async def bench_stages(agent, queries: List[str]) -> Dict[str, Dict]:
+    """process_query broken into its stages (each measured on its own), then end to end."""
+    from app.schemas import AgentQueryRequest
+    db, embedder, memory, llm = agent.db, agent.embedder, agent.memory, agent.llm
+    names = ["encode_text", "encode_clip_text", "search_facts", "search_misinfo", "search_images",
+             "search_memory", "memory_context", "memory_reinforce_flush", "verdict", "llm",
+             "memory_store", "end_to_end"]
+    samples = {name: [] for name in names}
+
+    for i, query in enumerate(queries):
+        vec = await timed(samples["encode_text"], embedder.aencode_text(query, use_cache=False))
+        clip_vec = await timed(samples["encode_clip_text"], embedder.aencode_text_for_image_search(query, use_cache=False))
+        facts = await timed(samples["search_facts"], db.asearch(db.COL_FACTS, vec, top_k=2))
+        misinfo = await timed(samples["search_misinfo"], db.asearch(db.COL_MISINFO, vec, top_k=2))
+        images = await timed(samples["search_images"], db.asearch(db.COL_IMAGES, clip_vec, top_k=2))
+        await timed(samples["search_memory"], db.asearch(db.COL_MEMORY, vec, top_k=3, filters={"user_id": BENCH_USER}))
+        await timed(samples["memory_context"], memory.get_context(BENCH_USER, query))
+        await timed(samples["memory_reinforce_flush"], memory.flush())
+
+        start = time.perf_counter()
+        analysis = agent._analysis(query, facts, misinfo, images)
+        samples["verdict"].append(time.perf_counter() - start)
+        # Unique query text: always a cache miss, i.e. a real call to the stub
+        await timed(samples["llm"], llm.grounded_answer(f"{query} #{uuid.uuid4().hex[:8]}", analysis["llm_context"], analysis["verdict"]))
+        await timed(samples["memory_store"], memory.add_memory(BENCH_USER, "bench", f"Query: {query} | Verdict: {analysis['verdict']}", memory_type="history"))
+
+        request = AgentQueryRequest(query=f"{query} ({i})", user_id=BENCH_USER, session_id="bench")
+        await timed(samples["end_to_end"], agent.process_query(request))
+
+    await memory.flush()
+    return {name: summarize(values) for name, values in samples.items()}
+
+async def bench_api(app, queries: List[str], concurrency: int, top_k: int) -> Dict[str, Dict]:
+    """GET /search and POST /search/batch through the ASGI app (no network), sequential and concurrent."""
+    import httpx
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async def search(query, samples):
+            start = time.perf_counter()
+            response = await client.get("/search", params={"q": query, "top_k": top_k})
+            response.raise_for_status()
+            samples.append(time.perf_counter() - start)
+
+        sequential = []
+        for query in queries:
+            await search(query, sequential)
+        results["search_sequential"] = summarize(sequential)
+
+        concurrent = []
+        limit = asyncio.Semaphore(concurrency)
+
+        async def bounded(query):
+            async with limit:
+                await search(query, concurrent)
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded(q) for q in queries))
+        results[f"search_concurrency_{concurrency}"] = summarize(concurrent, time.perf_counter() - start)
+
+        batch_size = min(64, len(queries))
+        batches = []
+        for i in range(0, len(queries), batch_size):
+            chunk = queries[i:i + batch_size]
+            start = time.perf_counter()
+            response = await client.post("/search/batch", json={"queries": chunk, "top_k": top_k})
+            response.raise_for_status()
+            batches.append(time.perf_counter() - start)
+        summary = summarize(batches)
+        summary["batch_size"] = batch_size
+        summary["queries_per_s"] = round(len(queries) / sum(batches), 2)
+        results["search_batch"] = summary
+    return results
+
+async def run_benchmarks(args, workdir: str) -> Dict:
+    from scripts.gen_dummy_data import generate_scaled_text_data, parse_scale
+    report = {"memory": {"start": rss_mb()}}
+
+    scale = parse_scale(args.scale)
+    # Own file names = own ingest source: the incremental delete pass never touches real records
+    facts_file, misinfo_file = generate_scaled_text_data(scale, os.path.join(workdir, "data"), args.seed, prefix="bench_")
+
+    if args.encoder == "hash":
+        use_hash_encoder()
+    # app.main owns the agent (and its models): stages and API share one copy, like production
+    from app.main import app, agent
+    from app.schemas import AgentQueryRequest
+    agent.init_db()
+    if args.warm_up and args.encoder == "model":
+        agent.embedder.warm_up(["text", "clip"], background=False)
+    report["memory"]["after_startup"] = rss_mb()
+
+    import scripts.ingest as ingest
+    ingest.CHECKPOINT_FILE = os.path.join(workdir, "ingest_checkpoint.json")
+    ingest.embedder = agent.embedder
+    report["ingest"] = bench_ingest({
+        "facts": (facts_file, agent.db.COL_FACTS),
+        "misinfo": (misinfo_file, agent.db.COL_MISINFO),
+    }, args.ingest_batch_size, args.ingest_workers)
+    report["memory"]["after_ingest"] = rss_mb()
+
+    await seed_memories(agent, args.memories)
+    queries = sample_queries([facts_file, misinfo_file], args.queries, args.seed)
+    # Untimed warm-up pass: model loading, client connections, first-call allocations
+    for query in queries[:5]:
+        await agent.analyze(AgentQueryRequest(query=query, user_id=BENCH_USER, session_id="warmup"))
+
+    report["stages"] = await bench_stages(agent, queries)
+    report["memory"]["after_stages"] = rss_mb()
+    report["api"] = await bench_api(app, queries, args.concurrency, args.top_k)
+    report["memory"]["after_api"] = rss_mb()
+    report["llm_stub"] = agent.llm.llm_stats()
+    await agent.llm.aclose()
+    await agent.memory.aclose()
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, process_query stages and /search.")
+    parser.add_argument("--scale", default="1k", help="facts in the synthetic corpus: 1k, 100k, 1M (myths: half as many)")
+    parser.add_argument("--queries", type=int, default=200, help="claims to run through each stage")
+    parser.add_argument("--memories", type=int, default=200, help="stored memories for the benchmark user")
+    parser.add_argument("--backend", choices=["embedded", "numpy", "remote"], default="embedded",
+                        help="vector store (remote = the configured Qdrant server; its collections get written!)")
+    parser.add_argument("--encoder", choices=["model", "hash"], default="model",
+                        help="real sentence-transformers models, or a hash stand-in to isolate everything else")
+    parser.add_argument("--answer-policy", choices=["llm", "tiered", "template"], default="llm",
+                        help="answer policy for the end_to_end stage (llm = always call the stub)")
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="LLM stub response time (seconds)")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight /search requests for the throughput run")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--ingest-batch-size", type=int, default=256)
+    parser.add_argument("--ingest-workers", type=int, default=4)
+    parser.add_argument("--no-warm-up", dest="warm_up", action="store_false", help="include model loading in the first samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="where corpus and vector store go (default: a temp dir)")
+    parser.add_argument("--out", default=None, help="JSON output path (default: benchmarks/results/<time>_<commit>_<scale>.json)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="healthguard-bench-")
+    configure_env(args, workdir)
+
+    started = time.time()
+    report = asyncio.run(run_benchmarks(args, workdir))
+    commit = git_commit()
+    report["meta"] = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "duration_s": round(time.time() - started, 1),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workdir": workdir,
+        **{k: v for k, v in vars(args).items() if k not in ("out", "workdir")},
+    }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}_{commit}_{args.scale}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\nStage latency (ms)            p50      p95      p99")
+    for name, stats in {**report["stages"], **report["api"]}.items():
+        if stats.get("n"):
+            print(f"  {name:<26} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+    for name, stats in report["ingest"].items():
+        print(f"  ingest {name:<30} {stats['records_per_s']:>10.1f} records/s")
+    print(f"  peak RSS: {report['memory']['after_api']['peak_rss_mb']} MB")
+    print(f"\n📊 Results written to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.run import RESULTS_DIR, free_port, git_commit
+
+# Memory per worker for the two multi-process modes (Linux only, reads /proc):
+#   preload - gunicorn.conf.py: models loaded once in the master, workers forked (copy-on-write)
+#   uvicorn - `uvicorn --workers N`: every worker imports the app and loads its own models
+# RSS counts shared pages in every process that maps them; PSS splits them between the sharers,
+# so sum(PSS) is what the machine actually spends.
+#
+#   python -m benchmarks.workers --workers 4
+#   python -m benchmarks.workers --workers 8 --mode preload --requests 400
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+def smaps_rollup(pid: int) -> Dict[str, float]:
+    """Memory of one process in MB (from /proc/<pid>/smaps_rollup)."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in SMAPS_FIELDS:
+                values[key.lower()] = round(int(rest.split()[0]) / 1024, 1)
+    return values
+
+def children(pid: int) -> List[int]:
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Fields after the ")" closing the command name: state, ppid, ...
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+def server_command(mode: str, workers: int, port: int) -> List[str]:
+    if mode == "preload":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "app.main:app"]
+    return [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)]
+
+def wait_ready(base_url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"server not ready after {timeout}s")
+
+def drive(base_url: str, requests: int) -> int:
+    # Exercise both models (text + CLIP) in every worker before measuring
+    ok = 0
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        for i in range(requests):
+            response = client.get("/search", params={"q": f"benchmark claim {i} about vaccines", "type": "all"})
+            ok += response.status_code == 200
+    return ok
+
+def measure(mode: str, workers: int, requests: int, ready_timeout: float) -> Dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    # HEALTHGUARD_WORKERS also sizes the per-worker torch thread pool in gunicorn.conf.py
+    env = {**os.environ, "HEALTHGUARD_WORKERS": str(workers), "HEALTHGUARD_WARMUP": os.getenv("HEALTHGUARD_WARMUP", "text,clip")}
+    print(f"🚀 {mode}: starting {workers} workers on :{port}")
+    server = subprocess.Popen(server_command(mode, workers, port), env=env, start_new_session=True)
+    try:
+        wait_ready(base_url, ready_timeout)
+        # Readiness is per worker; give the others time to finish booting too
+        time.sleep(2)
+        ok = drive(base_url, requests)
+        worker_pids = children(server.pid)
+        if mode == "uvicorn":
+            # uvicorn's supervisor -> multiprocessing spawn children (skip its resource tracker)
+            worker_pids = [pid for pid in worker_pids if smaps_rollup(pid).get("rss", 0) > 50]
+        master = smaps_rollup(server.pid)
+        per_worker = [smaps_rollup(pid) for pid in worker_pids]
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+
+    total_pss = master["pss"] + sum(w["pss"] for w in per_worker)
+    return {
+        "mode": mode,
+        "workers": len(per_worker),
+        "requests_ok": ok,
+        "master": master,
+        "per_worker": per_worker,
+        "avg_worker_rss_mb": round(sum(w["rss"] for w in per_worker) / max(1, len(per_worker)), 1),
+        "avg_worker_pss_mb": round(sum(w["pss"] for w in per_worker) / max(1, len(per_worker)), 1),
+        "total_pss_mb": round(total_pss, 1),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure memory per worker for preloaded vs. independent workers.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=["preload", "uvicorn", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200, help="/search requests sent before measuring")
+    parser.add_argument("--ready-timeout", type=float, default=300, help="seconds to wait for model loading")
+    parser.add_argument("--out", default=None, help="JSON output path (default: benchmarks/results/<time>_<commit>_workers.json)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    modes = ["preload", "uvicorn"] if args.mode == "both" else [args.mode]
+    results = [measure(mode, args.workers, args.requests, args.ready_timeout) for mode in modes]
+
+    commit = git_commit()
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{commit}_workers.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"commit": commit, "cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+    print("\n| mode | workers | master RSS (MB) | RSS / worker (MB) | PSS / worker (MB) | total PSS (MB) |")
+    print("|---|---|---|---|---|---|")
+    for r in results:
+        print(f"| {r['mode']} | {r['workers']} | {r['master']['rss']} | {r['avg_worker_rss_mb']} | {r['avg_worker_pss_mb']} | {r['total_pss_mb']} |")
+    print(f"\n📊 Results written to {out}")
+
+if __name__ == "__main__":
+    main()
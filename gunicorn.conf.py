@@ -0,0 +1,29 @@
+# Multi-worker serving: `make run-workers` or `gunicorn -c gunicorn.conf.py app.main:app`
+# The master imports the app, loads both embedding models and initialises the collections once
+# (preload_app + when_ready), then forks the workers: model weights are shared copy-on-write
+# instead of being loaded N times. Requires the remote Qdrant backend (embedded mode is single-process).
+import os
+
+bind = os.getenv("HEALTHGUARD_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("HEALTHGUARD_WORKERS", str(min(4, os.cpu_count() or 1))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Model loading happens in the master, so workers boot in well under the default timeout
+timeout = int(os.getenv("HEALTHGUARD_WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Split the cores between workers instead of every worker starting one torch thread per core
+# (read by app.embeddings at import, which happens after this file is loaded)
+os.environ.setdefault("HEALTHGUARD_TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+os.environ.setdefault("OMP_NUM_THREADS", os.environ["HEALTHGUARD_TORCH_THREADS"])
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker is forked
+    from app.main import preload_for_workers
+    preload_for_workers()
+    server.log.info("HealthGuard models and collections preloaded; forking %s workers", server.cfg.workers)
+
+def post_fork(server, worker):
+    server.log.info("Worker %s forked from preloaded master", worker.pid)
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from app.embeddings import EmbeddingModel, EMBED_BACKENDS
+
+DATA_DIR = "project/data"
+SAMPLE_FILES = [
+    (os.path.join(DATA_DIR, "medical_facts.jsonl"), "body"),
+    (os.path.join(DATA_DIR, "medical_misinfo.jsonl"), "body"),
+    (os.path.join(DATA_DIR, "medical_images.jsonl"), "caption"),
+]
+
+def load_samples(limit: int):
+    texts = []
+    for path, field in SAMPLE_FILES:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                text = json.loads(line).get(field)
+                if text:
+                    texts.append(text)
+    return texts[:limit]
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+def timed(fn, texts, repeats: int):
+    fn(texts[:1])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            fn([text])  # single-query latency is what matters for p50
+    per_query = (time.perf_counter() - start) / (repeats * len(texts))
+    return np.asarray(fn(texts)), per_query
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cosine drift and speed of an embedding backend vs the fp32 baseline.")
+    parser.add_argument("--backend", choices=EMBED_BACKENDS, default="int8")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads for both runs")
+    parser.add_argument("--limit", type=int, default=200, help="max sample texts from project/data")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="fail if mean cosine to fp32 is below this")
+    args = parser.parse_args()
+
+    texts = load_samples(args.limit)
+    if not texts:
+        print("No samples found in project/data (run `make ingest` first).")
+        sys.exit(1)
+
+    baseline = EmbeddingModel(backend="torch", threads=args.threads)
+    candidate = EmbeddingModel(backend=args.backend, threads=args.threads)
+    print(f"Comparing '{args.backend}' against fp32 on {len(texts)} samples...\n")
+
+    ok = True
+    for label, attr in [("MiniLM", "encode_texts"), ("CLIP text", "encode_texts_for_image_search")]:
+        ref, ref_ms = timed(getattr(baseline, attr), texts, args.repeats)
+        new, new_ms = timed(getattr(candidate, attr), texts, args.repeats)
+        cos = cosine_rows(ref, new)
+        print(f"{label:10s} cosine mean={cos.mean():.4f} min={cos.min():.4f} p5={np.percentile(cos, 5):.4f} | "
+              f"fp32 {ref_ms * 1000:.2f} ms/query -> {args.backend} {new_ms * 1000:.2f} ms/query "
+              f"({ref_ms / new_ms:.2f}x)")
+        ok = ok and cos.mean() >= args.min_cosine
+
+    print("\n✅ Drift within tolerance" if ok else f"\n❌ Mean cosine below {args.min_cosine}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import requests
 import sys
 import time
@@ -55,11 +56,13 @@ def main():
         from app.agent import MisinformationAgent
         from app.schemas import AgentQueryRequest
         agent = MisinformationAgent()
+        # One loop for the whole demo: the async Qdrant/OpenAI clients are bound to it
+        loop = asyncio.new_event_loop()
         
         def mock_send(u, s, q):
             print(f"\n>> USER: {q}")
             req = AgentQueryRequest(user_id=u, session_id=s, query=q)
-            res = agent.process_query(req)
+            res = loop.run_until_complete(agent.process_query(req))
             print(f">> AGENT: {res.final_answer}")
             print("\n   [Evidence Used]:")
             for item in res.evidence:
@@ -71,6 +74,8 @@ def main():
         mock_send(user_id, session_id, "Is the earth flat?")
         mock_send(user_id, session_id, "What did I just ask?")
         mock_send(user_id, session_id, "Do vaccines contain microchips?")
+        loop.run_until_complete(agent.llm.aclose())
+        loop.run_until_complete(agent.memory.aclose())
         
         return
 
@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 import random
@@ -70,9 +71,9 @@ CONDITIONS = {
     }
 }
 
-def create_record(prefix, text, label, topic, is_fact):
+def create_record(prefix, text, label, topic, is_fact, doc_id=None):
     return {
-        "doc_id": f"{prefix}_{random.randint(10000,99999)}",
+        "doc_id": doc_id or f"{prefix}_{random.randint(10000,99999)}",
         "title": f"Medical {'Fact' if is_fact else 'Myth'}: {topic.title()}",
         "body": text,
         "source": "Global Health Authority" if is_fact else "Unverified Online Source",
@@ -110,6 +111,46 @@ def generate_text_data():
 
     print(f"Generated {len(facts)} facts and {len(misinfo)} myths.")
 
+# --- SCALED CORPORA (benchmarks) ---
+# Template sentences are varied with a population and a qualifier so large corpora aren't just
+# duplicates (which would make every search trivially tie)
+POPULATIONS = ["in adults", "in children", "in older adults", "during pregnancy", "in athletes",
+               "in people with chronic illness", "in teenagers", "in healthcare workers"]
+QUALIFIERS = ["according to clinical guidelines", "in most reported cases", "based on cohort studies",
+              "as noted by public health agencies", "in randomized trials", "per recent reviews",
+              "in observational data", "in regional surveys"]
+
+def parse_scale(value) -> int:
+    # "1k" -> 1000, "100k" -> 100000, "1M" -> 1000000
+    value = str(value).strip().lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+def _scaled_records(prefix: str, count: int, key: str, is_fact: bool):
+    topics = list(CONDITIONS.items())
+    for i in range(count):
+        topic, data = topics[i % len(topics)]
+        base = random.choice(data[key]).rstrip(".")
+        text = f"{base} {random.choice(POPULATIONS)}, {random.choice(QUALIFIERS)} (ref {i})."
+        yield create_record(prefix, text, "fact" if is_fact else "misinfo", topic, is_fact, doc_id=f"{prefix}_{i}")
+
+def generate_scaled_text_data(scale: int, data_dir: str = DATA_DIR, seed: int = 0, prefix: str = ""):
+    """
+    Synthetic corpus of `scale` facts and scale // 2 myths, written line by line (1M records
+    never sit in memory). Deterministic for a given seed, so benchmark runs are comparable.
+    `prefix` renames the files, and with them the ingest source incremental deletes are scoped to.
+    """
+    random.seed(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    facts_file = os.path.join(data_dir, f"{prefix}medical_facts.jsonl")
+    misinfo_file = os.path.join(data_dir, f"{prefix}medical_misinfo.jsonl")
+    print(f"Generating scaled medical dataset ({scale} facts, {scale // 2} myths) in {data_dir}...")
+    with open(facts_file, 'w') as f:
+        for entry in _scaled_records("fact", scale, "facts", True): f.write(json.dumps(entry) + "\n")
+    with open(misinfo_file, 'w') as f:
+        for entry in _scaled_records("myth", scale // 2, "myths", False): f.write(json.dumps(entry) + "\n")
+    return facts_file, misinfo_file
+
 # Keeping image generation simple/placeholder for now as user asked for 'capability to answer', which is largely text-based for RAG
 # (Re-using previous image logic or leaving as is if file exists is fine, but let's regenerate for consistency)
 def generate_image_data():
@@ -143,5 +184,13 @@ def generate_image_data():
         for entry in image_metadata: f.write(json.dumps(entry) + "\n")
 
 if __name__ == "__main__":
-    generate_text_data()
-    generate_image_data()
+    parser = argparse.ArgumentParser(description="Generate the demo (or a scaled synthetic) medical dataset.")
+    parser.add_argument("--scale", default=None, help="synthetic corpus size, e.g. 1k, 100k, 1M (default: curated demo set)")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="output directory for --scale")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.scale:
+        generate_scaled_text_data(parse_scale(args.scale), args.data_dir, args.seed)
+    else:
+        generate_text_data()
+        generate_image_data()
@@ -0,0 +1,71 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple
+from app.embeddings import CLIP_MODEL_NAME
+from app.qdrant_client_wrapper import QdrantHandler
+
+# Stored in every ingested payload; a change of either forces a re-embed (text records pass
+# EmbeddingModel.model_version, so switching the inference backend re-embeds them too)
+HASH_FIELD = "content_hash"
+MODEL_FIELD = "embed_model"
+SOURCE_FIELD = "ingest_source"
+# Image vectors always come from the fp32 vision tower (only CLIP's text tower is ever quantized)
+IMAGE_MODEL_VERSION = CLIP_MODEL_NAME
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def record_fingerprint(record: Dict[str, Any], **extra: Any) -> str:
+    """The whole record (plus `extra`), canonically serialised: any field edit counts as a change."""
+    return json.dumps({**record, **extra}, sort_keys=True, default=str)
+
+class IngestReport:
+    """Added / updated / unchanged / deleted counters for one ingestion run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+    def __str__(self):
+        return (f"{self.name}: {self.added} added, {self.updated} updated, "
+                f"{self.unchanged} unchanged, {self.deleted} deleted")
+
+def select_changed(db: QdrantHandler, collection_name: str, items: List[Tuple[str, str]],
+                   report: IngestReport, model_version: str) -> List[int]:
+    """
+    Given [(point_id, fingerprint)] (see record_fingerprint), fetches the stored hashes in ONE bulk
+    lookup and returns the indexes of items that are new or whose record/model changed. Updates `report`.
+    """
+    existing = db.get_payloads(collection_name, [pid for pid, _ in items], [HASH_FIELD, MODEL_FIELD])
+    changed = []
+    for i, (pid, fingerprint) in enumerate(items):
+        stored = existing.get(pid)
+        if stored is None:
+            report.added += 1
+            changed.append(i)
+        elif stored.get(HASH_FIELD) != content_hash(fingerprint) or stored.get(MODEL_FIELD) != model_version:
+            report.updated += 1
+            changed.append(i)
+        else:
+            report.unchanged += 1
+    return changed
+
+def count_existing(db: QdrantHandler, collection_name: str, point_ids: List[str], report: IngestReport):
+    """Full (non-incremental) runs rewrite every point: counts which ones are new vs. updated."""
+    existing = db.get_payloads(collection_name, point_ids, [HASH_FIELD])
+    updated = sum(1 for pid in point_ids if pid in existing)
+    report.updated += updated
+    report.added += len(point_ids) - updated
+
+def stamp(payload: Dict, fingerprint: str, source: str, model_version: str) -> Dict:
+    """Adds the hash / model version / source markers to a payload before upsert."""
+    return {**payload, HASH_FIELD: content_hash(fingerprint), MODEL_FIELD: model_version, SOURCE_FIELD: source}
+
+def delete_missing(db: QdrantHandler, collection_name: str, source: str, seen_ids: set, report: IngestReport):
+    """Deletes points previously ingested from `source` that are no longer present in it."""
+    stale = [pid for pid in db.list_ids(collection_name, {SOURCE_FIELD: source}) if pid not in seen_ids]
+    db.delete_points(collection_name, stale)
+    report.deleted += len(stale)
@@ -1,84 +1,249 @@
+import argparse
 import json
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
 from qdrant_client.http import models
-from app.embeddings import EmbeddingModel
-from app.qdrant_client_wrapper import QdrantHandler
+from app.embeddings import EmbeddingModel, TEXT_MODEL_NAME
+from app.image_pipeline import encode_image_files, IMAGE_BATCH_SIZE
+from app.qdrant_client_wrapper import get_qdrant_handler
+from scripts.incremental import (
+    IMAGE_MODEL_VERSION, IngestReport, count_existing, record_fingerprint, select_changed, stamp, delete_missing
+)
 
 # Initialize services
-db = QdrantHandler()
+db = get_qdrant_handler()
 embedder = EmbeddingModel()
 
 DATA_DIR = "project/data"
 FACTS_FILE = os.path.join(DATA_DIR, "medical_facts.jsonl")
 MISINFO_FILE = os.path.join(DATA_DIR, "medical_misinfo.jsonl")
 IMG_META_FILE = os.path.join(DATA_DIR, "medical_images.jsonl")
+CHECKPOINT_FILE = os.path.join(DATA_DIR, ".ingest_checkpoint.json")
 
-def ingest_file(file_path, collection_name, content_field='body'):
+# Pipeline defaults (override on the command line)
+BATCH_SIZE = 256       # records per hash lookup, encode call and upsert chunk (the encoder
+                       # splits each call into HEALTHGUARD_BULK_BATCH_SIZE forward passes)
+UPSERT_WORKERS = 4     # concurrent upsert requests
+MAX_PENDING = 8        # bounded queue: encoded batches waiting for / in upsert
+
+# --- Checkpointing ---
+# {file_path: number of lines fully upserted}; a crashed run resumes from there
+def load_checkpoint() -> Dict[str, int]:
+    if os.path.exists(CHECKPOINT_FILE):
+        with open(CHECKPOINT_FILE) as f:
+            return json.load(f)
+    return {}
+
+def save_checkpoint(file_path: str, lines_done: int):
+    state = load_checkpoint()
+    state[file_path] = lines_done
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, CHECKPOINT_FILE)
+
+def clear_checkpoint(file_path: str):
+    state = load_checkpoint()
+    if state.pop(file_path, None) is not None:
+        with open(CHECKPOINT_FILE, "w") as f:
+            json.dump(state, f)
+
+# --- Pipeline stages ---
+def read_records(file_path: str, start_line: int = 0) -> Iterator[Tuple[int, dict]]:
+    """Streams (line_number, record) pairs, skipping the first `start_line` lines."""
+    with open(file_path, 'r') as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no <= start_line or not line.strip():
+                continue
+            yield line_no, json.loads(line)
+
+def batched(iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def build_points(batch: List[Tuple[int, dict]], collection_name: str, content_field: str, source: str,
+                 report: IngestReport, incremental: bool = True, seen_ids: set = None) -> List[models.PointStruct]:
+    docs = [doc for _, doc in batch if doc.get(content_field)]
+    # Using doc_id or img_id as unique key
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_DNS, doc.get('doc_id') or doc.get('img_id'))) for doc in docs]
+    if seen_ids is not None:
+        seen_ids.update(ids)
+
+    # Incremental mode: one bulk hash lookup, then only new/changed records are encoded. The whole
+    # record is fingerprinted, so edits to title/topic/date... refresh the stored payload too
+    model_version = embedder.model_version(TEXT_MODEL_NAME)
+    fingerprints = [record_fingerprint(doc) for doc in docs]
+    if incremental:
+        keep = select_changed(db, collection_name, list(zip(ids, fingerprints)), report, model_version)
+    else:
+        keep = list(range(len(docs)))
+        count_existing(db, collection_name, ids, report)
+    if not keep:
+        return []
+
+    docs = [docs[i] for i in keep]
+    ids = [ids[i] for i in keep]
+    fingerprints = [fingerprints[i] for i in keep]
+    # One encode call for the whole chunk (forward passes of BULK_BATCH_SIZE inside)
+    vectors = embedder.encode_texts([doc[content_field] for doc in docs])
+    return [
+        models.PointStruct(
+            id=pid,
+            vector=vector,
+            payload=stamp(doc, fingerprint, source, model_version)
+        )
+        for pid, doc, fingerprint, vector in zip(ids, docs, fingerprints, vectors)
+    ]
+
+def ingest_file(file_path, collection_name, content_field='body', batch_size=BATCH_SIZE,
+                workers=UPSERT_WORKERS, resume=True, incremental=True):
+    """
+    Streaming ingestion: read JSONL lazily -> encode in batches -> upsert chunks concurrently
+    (wait=False) through a bounded queue. Progress is checkpointed after every contiguous
+    completed chunk, so memory stays O(batch_size * MAX_PENDING) and crashes resume.
+    In incremental mode unchanged records (same content hash + model) are skipped and records
+    that disappeared from the file are deleted.
+    """
     print(f"Ingesting into {collection_name} from {file_path}...")
-    points = []
     if not os.path.exists(file_path):
         print(f"File not found: {file_path}")
         return
 
-    with open(file_path, 'r') as f:
-        for line in f:
-            doc = json.loads(line)
-            # Embed based on content type (text body vs image path)
-            text_content = doc.get(content_field)
-            if not text_content: continue
-            
-            vector = embedder.encode_text(text_content)
-            
-            # Using doc_id or img_id as unique key
-            unique_id = doc.get('doc_id') or doc.get('img_id')
-            
-            point = models.PointStruct(
-                id=str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_id)),
-                vector=vector,
-                payload=doc
-            )
-            points.append(point)
-    
-    if points:
-        db.upsert_points(collection_name, points)
-        print(f"Upserted {len(points)} items into {collection_name}.")
+    start_line = load_checkpoint().get(file_path, 0) if resume else 0
+    if start_line:
+        print(f"Resuming after line {start_line} (checkpoint)")
+
+    slots = threading.BoundedSemaphore(MAX_PENDING)
+    in_flight = []  # [(last_line, future)] in submission order
+    total = 0
+    source = os.path.basename(file_path)
+    report = IngestReport(collection_name)
+    # Deletions are only safe when we've seen the whole file in this run
+    seen_ids = set() if incremental and not start_line else None
+
+    def upsert(points):
+        try:
+            if points:
+                db.upsert_points(collection_name, points, wait=False)
+        finally:
+            slots.release()
+
+    def commit_done(block: bool):
+        # Advance the checkpoint over the longest prefix of finished chunks
+        last_line = None
+        try:
+            while in_flight and (block or in_flight[0][1].done()):
+                line, future = in_flight.pop(0)
+                future.result()  # re-raise upsert errors: never checkpoint past a failed chunk
+                last_line = line
+        finally:
+            if last_line is not None:
+                save_checkpoint(file_path, last_line)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upsert") as pool:
+        for batch in batched(read_records(file_path, start_line), batch_size):
+            points = build_points(batch, collection_name, content_field, source, report, incremental, seen_ids)
+            slots.acquire()  # backpressure: encoding waits when upserts fall behind
+            in_flight.append((batch[-1][0], pool.submit(upsert, points)))
+            total += len(points)
+            commit_done(block=False)
+        commit_done(block=True)
+
+    if seen_ids is not None:
+        delete_missing(db, collection_name, source, seen_ids, report)
+
+    # Finished cleanly: the next run starts from the top again
+    clear_checkpoint(file_path)
+    print(f"Upserted {total} items into {collection_name}. {report}")
 
-def ingest_images():
+def image_fingerprint(meta: dict) -> str:
+    # The vector depends on the file's bytes and the payload on its metadata line: a change to
+    # either (new mtime/size, edited caption...) re-ingests the image
+    st = os.stat(meta['file_path'])
+    return record_fingerprint(meta, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+def ingest_images(batch_size=IMAGE_BATCH_SIZE, workers=None, incremental=True):
+    """
+    Parallel decode/resize + batched CLIP encoding, upserted chunk by chunk. In incremental mode
+    only new/changed images are encoded and images removed from the metadata file are deleted.
+    """
     print("Ingesting Images...")
-    points = []
     if not os.path.exists(IMG_META_FILE):
         print("No image metadata found.")
         return
 
+    metas = []
     with open(IMG_META_FILE, 'r') as f:
         for line in f:
             meta = json.loads(line)
-            path = meta['file_path']
-            if os.path.exists(path):
-                vector = embedder.encode_image(path)
-                
-                point = models.PointStruct(
-                    id=str(uuid.uuid5(uuid.NAMESPACE_DNS, meta['img_id'])),
-                    vector=vector,
-                    payload=meta
-                )
-                points.append(point)
+            if os.path.exists(meta['file_path']):
+                metas.append(meta)
             else:
-                print(f"Warning: Image file not found {path}")
+                print(f"Warning: Image file not found {meta['file_path']}")
+
+    source = os.path.basename(IMG_META_FILE)
+    report = IngestReport(db.COL_IMAGES)
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_DNS, meta['img_id'])) for meta in metas]
+    fingerprints = [image_fingerprint(meta) for meta in metas]
+    if incremental:
+        # Bulk hash lookups, BATCH_SIZE ids at a time
+        keep = []
+        for chunk in batched(range(len(metas)), BATCH_SIZE):
+            changed = select_changed(db, db.COL_IMAGES, [(ids[i], fingerprints[i]) for i in chunk], report, IMAGE_MODEL_VERSION)
+            keep.extend(chunk[j] for j in changed)
+    else:
+        keep = list(range(len(metas)))
+        count_existing(db, db.COL_IMAGES, ids, report)
+
+    points = []
+    total = 0
+    vectors = encode_image_files(embedder, [metas[i]['file_path'] for i in keep], batch_size=batch_size, workers=workers)
+    for i, (_, vector) in zip(keep, vectors):
+        if vector is None:
+            continue
+        points.append(models.PointStruct(
+            id=ids[i],
+            vector=vector,
+            payload=stamp(metas[i], fingerprints[i], source, IMAGE_MODEL_VERSION)
+        ))
+        if len(points) >= batch_size:
+            db.upsert_points(db.COL_IMAGES, points, wait=False)
+            total += len(points)
+            points = []
     
     if points:
         db.upsert_points(db.COL_IMAGES, points)
-        print(f"Upserted {len(points)} images into {db.COL_IMAGES}.")
+        total += len(points)
+
+    if incremental:
+        delete_missing(db, db.COL_IMAGES, source, set(ids), report)
+    print(f"Upserted {total} images into {db.COL_IMAGES}. {report}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-ingest the medical knowledge base into Qdrant.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="records per hash lookup / encode call / upsert chunk (forward-pass size is HEALTHGUARD_BULK_BATCH_SIZE)")
+    parser.add_argument("--workers", type=int, default=UPSERT_WORKERS, help="concurrent upsert requests")
+    parser.add_argument("--no-resume", action="store_true", help="ignore the checkpoint and start from the top")
+    parser.add_argument("--image-batch-size", type=int, default=IMAGE_BATCH_SIZE, help="images per CLIP forward pass")
+    parser.add_argument("--image-workers", type=int, default=None, help="decode/resize processes (default: CPU count)")
+    parser.add_argument("--full", action="store_true", help="re-embed every record instead of only new/changed ones")
+    args = parser.parse_args()
+
     db.init_collections()
     
     # Ingest Facts
-    ingest_file(FACTS_FILE, db.COL_FACTS)
+    ingest_file(FACTS_FILE, db.COL_FACTS, batch_size=args.batch_size, workers=args.workers, resume=not args.no_resume, incremental=not args.full)
     
     # Ingest Misinformation (Knowledge of what is fake is as important as what is real)
-    ingest_file(MISINFO_FILE, db.COL_MISINFO)
+    ingest_file(MISINFO_FILE, db.COL_MISINFO, batch_size=args.batch_size, workers=args.workers, resume=not args.no_resume, incremental=not args.full)
     
     # Ingest Images
-    ingest_images()
+    ingest_images(batch_size=args.image_batch_size, workers=args.image_workers, incremental=not args.full)
@@ -1,10 +1,16 @@
-
+import argparse
+import asyncio
+import json
+import os
 import feedparser
+import httpx
 import uuid
 import time
-from app.qdrant_client_wrapper import QdrantHandler
-from app.embeddings import EmbeddingModel
+from typing import Dict, List, Optional, Tuple
+from app.qdrant_client_wrapper import get_qdrant_handler
+from app.embeddings import EmbeddingModel, TEXT_MODEL_NAME
 from qdrant_client.http import models
+from scripts.incremental import IngestReport, record_fingerprint, select_changed, stamp
 
 # RSS Feeds for Real-Time Medical Data
 FEEDS = [
@@ -13,70 +19,164 @@ FEEDS = [
     "https://www.who.int/feeds/entity/news/en/rss.xml" # WHO News
 ]
 
-def ingest_live_feeds():
+# Per-feed HTTP state (ETag / Last-Modified) and the entry ids already ingested
+STATE_FILE = "project/data/.feed_state.json"
+FEED_TIMEOUT = 15.0         # seconds per feed
+MAX_SEEN_PER_FEED = 5000    # bound the remembered entry ids per feed
+POLL_INTERVAL = 900         # seconds between polls in --daemon mode
+
+def load_state(path: str = STATE_FILE) -> Dict[str, Dict]:
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_state(state: Dict[str, Dict], path: str = STATE_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+async def fetch_feed(client: httpx.AsyncClient, feed_url: str, feed_state: Dict) -> Optional[feedparser.FeedParserDict]:
+    """Conditional GET: returns the parsed feed, or None if unchanged (304) or failed."""
+    headers = {}
+    if feed_state.get("etag"):
+        headers["If-None-Match"] = feed_state["etag"]
+    if feed_state.get("last_modified"):
+        headers["If-Modified-Since"] = feed_state["last_modified"]
+
+    print(f"📡 Fetching: {feed_url}...")
+    try:
+        response = await asyncio.wait_for(client.get(feed_url, headers=headers), FEED_TIMEOUT)
+        if response.status_code == 304:
+            print(f"   ⏭️  Not modified: {feed_url}")
+            return None
+        response.raise_for_status()
+    except Exception as e:
+        print(f"   ❌ Failed to fetch feed {feed_url}: {e!r}")
+        return None
+
+    feed_state["etag"] = response.headers.get("ETag")
+    feed_state["last_modified"] = response.headers.get("Last-Modified")
+    feed = feedparser.parse(response.content)
+    print(f"   Found {len(feed.entries)} entries.")
+    return feed
+
+def parse_entries(feed, feed_url: str) -> List[Tuple[str, str, Dict]]:
+    items = []
+    for entry in feed.entries:
+        # Extract Data
+        title = entry.get('title', 'No Title')
+        summary = entry.get('summary', '') or entry.get('description', '')
+        link = entry.get('link', '')
+        # ISO 8601 so the `date` datetime index and min_date filters understand it
+        parsed = entry.get('published_parsed') or entry.get('updated_parsed')
+        published = time.strftime("%Y-%m-%dT%H:%M:%SZ", parsed) if parsed else time.strftime("%Y-%m-%d")
+        
+        # Create Body Text for Embedding
+        # We combine Title + Summary for better semantic search context
+        text_content = f"{title}. {summary}"
+        
+        # We use uuid5 based on link to ensure idempotency (deduplication)
+        doc_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, link))
+        
+        # Create Payload
+        payload = {
+            "doc_id": doc_id,
+            "title": title,
+            "body": summary[:1000], # Limit payload size
+            "source": f"Live Feed ({feed.feed.get('title', 'Medical RSS')})",
+            "date": published,
+            "topic": "live_medical_news",
+            "content_type": "text",
+            "url": link,
+            "veracity": "fact" # Assume trusted sources like NIH/WHO are facts
+        }
+        items.append((doc_id, text_content, payload))
+    return items
+
+async def poll_feeds(db, embedder: EmbeddingModel, feeds: List[str], state: Dict[str, Dict]) -> IngestReport:
+    """
+    One polling round: fetch all feeds concurrently, keep only entries not seen before,
+    then batch-embed and upsert them in one go. `state` is updated in place.
+    """
+    # Feeds roll over, so entries that drop out of a feed are kept (no deletions here)
+    report = IngestReport(db.COL_FACTS)
+
+    async with httpx.AsyncClient(follow_redirects=True, timeout=FEED_TIMEOUT) as client:
+        feed_states = [state.setdefault(url, {}) for url in feeds]
+        parsed = await asyncio.gather(*(fetch_feed(client, url, fs) for url, fs in zip(feeds, feed_states)))
+
+    new_items = []  # (feed_url, doc_id, text, payload)
+    for feed_url, feed, feed_state in zip(feeds, parsed, feed_states):
+        if feed is None:
+            continue
+        seen = set(feed_state.get("seen", []))
+        for doc_id, text, payload in parse_entries(feed, feed_url):
+            if doc_id not in seen:
+                new_items.append((feed_url, doc_id, text, payload))
+
+    if new_items:
+        # Incremental: one bulk hash lookup, then batch-encode only new/changed entries
+        # (the embedded text is fingerprinted along with the payload: the body is stored truncated)
+        model_version = embedder.model_version(TEXT_MODEL_NAME)
+        fingerprints = [record_fingerprint(payload, text=text) for _, _, text, payload in new_items]
+        changed_idx = await asyncio.to_thread(
+            select_changed, db, db.COL_FACTS, [(item[1], fp) for item, fp in zip(new_items, fingerprints)], report, model_version
+        )
+        changed = [(new_items[i], fingerprints[i]) for i in changed_idx]
+        if changed:
+            vectors = await asyncio.to_thread(embedder.encode_texts, [item[2] for item, _ in changed])
+            points = [
+                models.PointStruct(id=doc_id, vector=vector, payload=stamp(payload, fingerprint, feed_url, model_version))
+                for ((feed_url, doc_id, text, payload), fingerprint), vector in zip(changed, vectors)
+            ]
+            # Batch Upsert
+            await asyncio.to_thread(db.upsert_points, db.COL_FACTS, points)
+            print(f"   ✅ Ingested {len(points)} new/updated articles")
+
+    # Only remember entries once they are safely stored
+    for feed_url, doc_id, _, _ in new_items:
+        feed_state = state[feed_url]
+        feed_state.setdefault("seen", []).append(doc_id)
+    for feed_state in state.values():
+        feed_state["seen"] = feed_state.get("seen", [])[-MAX_SEEN_PER_FEED:]
+    return report
+
+async def poll_once(db, embedder: EmbeddingModel, feeds: List[str], state_file: str) -> IngestReport:
+    state = load_state(state_file)
+    report = await poll_feeds(db, embedder, feeds, state)
+    save_state(state, state_file)
+    print(f"\n🎉 Live Ingestion Complete! {report}")
+    return report
+
+async def run(feeds: List[str], daemon: bool = False, interval: float = POLL_INTERVAL, state_file: str = STATE_FILE):
     print("🚀 Starting Live BioMedical Ingestion...")
     
     # Initialize Core Systems
-    db = QdrantHandler()
+    db = get_qdrant_handler()
     embedder = EmbeddingModel()
     db.init_collections() # Ensure collections exist
-    
-    total_ingested = 0
-    
-    for feed_url in FEEDS:
-        print(f"📡 Fetching: {feed_url}...")
+
+    while True:
+        if not daemon:
+            return await poll_once(db, embedder, feeds, state_file)
         try:
-            feed = feedparser.parse(feed_url)
-            print(f"   Found {len(feed.entries)} entries.")
-            
-            points = []
-            for entry in feed.entries:
-                # Extract Data
-                title = entry.get('title', 'No Title')
-                summary = entry.get('summary', '') or entry.get('description', '')
-                link = entry.get('link', '')
-                published = entry.get('published', time.strftime("%Y-%m-%d"))
-                
-                # Create Body Text for Embedding
-                # We combine Title + Summary for better semantic search context
-                text_content = f"{title}. {summary}"
-                
-                # Check for duplicates (Optional simple check or just upsert)
-                # We use uuid5 based on link to ensure idempotency (deduplication)
-                doc_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, link))
-                
-                # Create Vector
-                vector = embedder.encode_text(text_content)
-                
-                # Create Payload
-                payload = {
-                    "doc_id": doc_id,
-                    "title": title,
-                    "body": summary[:1000], # Limit payload size
-                    "source": f"Live Feed ({feed.feed.get('title', 'Medical RSS')})",
-                    "date": published,
-                    "topic": "live_medical_news",
-                    "content_type": "text",
-                    "url": link,
-                    "veracity": "fact" # Assume trusted sources like NIH/WHO are facts
-                }
-                
-                points.append(models.PointStruct(
-                    id=doc_id,
-                    vector=vector,
-                    payload=payload
-                ))
-            
-            # Batch Upsert
-            if points:
-                db.upsert_points(db.COL_FACTS, points)
-                print(f"   ✅ Ingested {len(points)} articles from {feed_url}")
-                total_ingested += len(points)
-                
+            await poll_once(db, embedder, feeds, state_file)
         except Exception as e:
-            print(f"   ❌ Failed to process feed {feed_url}: {e}")
+            # One bad round (Qdrant down, corrupt state file...) must not end the daemon
+            print(f"❌ Poll failed: {e}")
+        print(f"💤 Next poll in {interval:.0f}s")
+        await asyncio.sleep(interval)
 
-    print(f"\n🎉 Live Ingestion Complete! Total new records: {total_ingested}")
+def ingest_live_feeds(feeds: List[str] = None):
+    return asyncio.run(run(feeds or FEEDS))
 
 if __name__ == "__main__":
-    ingest_live_feeds()
+    parser = argparse.ArgumentParser(description="Poll medical RSS feeds and ingest new entries.")
+    parser.add_argument("--feeds", nargs="+", default=FEEDS, help="feed URLs (defaults to the built-in WHO/CDC/PubMed feeds)")
+    parser.add_argument("--daemon", action="store_true", help="keep polling every --interval seconds")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between polls in daemon mode")
+    parser.add_argument("--state-file", default=STATE_FILE, help="where ETags and seen entry ids are kept")
+    args = parser.parse_args()
+    asyncio.run(run(args.feeds, args.daemon, args.interval, args.state_file))
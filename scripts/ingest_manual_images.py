@@ -3,7 +3,8 @@ import os
 import shutil
 import uuid
 from app.embeddings import EmbeddingModel
-from app.qdrant_client_wrapper import QdrantHandler
+from app.image_pipeline import encode_image_files
+from app.qdrant_client_wrapper import get_qdrant_handler
 from qdrant_client.http import models
 
 # Source Images (uploaded by user)
@@ -18,11 +19,11 @@ os.makedirs(DEST_DIR, exist_ok=True)
 def ingest_manual_images():
     print("🚀 Starting Manual Image Ingestion (True Vision Search)...")
     
-    db = QdrantHandler()
+    db = get_qdrant_handler()
     embedder = EmbeddingModel()
     db.init_collections()
     
-    points = []
+    copied = []  # (index, src_path, dest_path)
     
     for i, src_path in enumerate(SOURCE_IMAGES):
         if not os.path.exists(src_path):
@@ -34,32 +35,34 @@ def ingest_manual_images():
         dest_path = os.path.join(DEST_DIR, filename)
         shutil.copy(src_path, dest_path)
         print(f"📸 Copied image to {dest_path}")
-        
-        # Encode Image (Pixel-Level CLIP Embedding)
-        try:
-            vector = embedder.encode_image(dest_path)
-            
-            # Create Payload
-            payload = {
-                "img_id": f"real_upload_{i}",
-                "caption": "High-Resolution Anatomical Scan (Trusted Source)",
-                "source": "User Uploaded Reference",
-                "date": "2025-06-01",
-                "topic": "anatomy",
-                "content_type": "image",
-                "file_path": os.path.abspath(dest_path),
-                "veracity": "fact"
-            }
-            
-            points.append(models.PointStruct(
-                id=str(uuid.uuid5(uuid.NAMESPACE_DNS, src_path)),
-                vector=vector,
-                payload=payload
-            ))
-            print(f"✅ Encoded image {i} successfully.")
+        copied.append((i, src_path, dest_path))
+
+    # Encode Images (Pixel-Level CLIP Embedding): parallel decode/downsize + one batched CLIP pass
+    points = []
+    vectors = encode_image_files(embedder, [dest_path for _, _, dest_path in copied])
+    for (i, src_path, dest_path), (_, vector) in zip(copied, vectors):
+        if vector is None:
+            print(f"❌ Failed to encode {src_path}")
+            continue
             
-        except Exception as e:
-            print(f"❌ Failed to encode {src_path}: {e}")
+        # Create Payload
+        payload = {
+            "img_id": f"real_upload_{i}",
+            "caption": "High-Resolution Anatomical Scan (Trusted Source)",
+            "source": "User Uploaded Reference",
+            "date": "2025-06-01",
+            "topic": "anatomy",
+            "content_type": "image",
+            "file_path": os.path.abspath(dest_path),
+            "veracity": "fact"
+        }
+        
+        points.append(models.PointStruct(
+            id=str(uuid.uuid5(uuid.NAMESPACE_DNS, src_path)),
+            vector=vector,
+            payload=payload
+        ))
+        print(f"✅ Encoded image {i} successfully.")
 
     if points:
         db.upsert_points(db.COL_IMAGES, points)
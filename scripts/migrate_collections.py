@@ -0,0 +1,26 @@
+import argparse
+from app.qdrant_client_wrapper import get_qdrant_handler
+
+def migrate_collections(names=None, dry_run: bool = False):
+    """Applies the configured quantization / on-disk / HNSW settings to existing collections."""
+    db = get_qdrant_handler()
+    names = names or [db.COL_FACTS, db.COL_MISINFO, db.COL_IMAGES, db.COL_MEMORY]
+
+    for name in names:
+        backend = db.backend_for(name)
+        config = db.config_for(name)
+        if not backend.collection_exists(name):
+            print(f"⏭️  {name}: does not exist (will be created with these settings by init_collections)")
+            continue
+        print(f"🔧 {name} ({backend.kind}): {config.dict(exclude_defaults=True) or 'defaults (fp32, in RAM)'}")
+        if not dry_run:
+            backend.update_collection(name, config)
+    # Qdrant rebuilds quantized vectors / HNSW in the background: collections stay searchable
+    print("Done." if not dry_run else "Dry run: nothing changed.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply collection storage/index settings to existing collections.")
+    parser.add_argument("collections", nargs="*", help="collections to migrate (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would change")
+    args = parser.parse_args()
+    migrate_collections(args.collections, args.dry_run)
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Minimal OpenAI-compatible chat completions server for exercising LLMService's deadlines,
+# circuit breaker and concurrency limit without a real provider:
+#   python -m scripts.mock_llm_server --delay 2 --fail-rate 0.3
+#   OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=mock make run-api
+
+app = FastAPI(title="Mock LLM")
+settings = {"delay": 0.2, "jitter": 0.0, "fail_rate": 0.0, "token_delay": 0.02}
+stats = {"requests": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+def _answer(messages) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    verdict = next((line.split(":", 1)[1].strip() for line in prompt.splitlines() if line.startswith("Verdict:")), "Unknown")
+    return f"(mock) The evidence supports the verdict '{verdict}'. Consult a doctor for personal advice."
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(settings["delay"] + random.uniform(0, settings["jitter"]))
+        if random.random() < settings["fail_rate"]:
+            stats["failed"] += 1
+            return JSONResponse({"error": {"message": "mock failure", "type": "server_error"}}, status_code=500)
+    finally:
+        stats["in_flight"] -= 1
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "mock")
+    text = _answer(body.get("messages", []))
+    if not body.get("stream"):
+        return {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    async def events():
+        for word in text.split(" "):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(settings["token_delay"])
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, **settings}
+
+@app.post("/settings")
+async def update_settings(changes: dict):
+    # Change behaviour at runtime, e.g. {"delay": 10} to trip the deadline / circuit breaker
+    settings.update({k: float(v) for k, v in changes.items() if k in settings})
+    return settings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--delay", type=float, default=settings["delay"], help="seconds before answering")
+    parser.add_argument("--jitter", type=float, default=settings["jitter"], help="extra random delay (seconds)")
+    parser.add_argument("--fail-rate", type=float, default=settings["fail_rate"], help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--token-delay", type=float, default=settings["token_delay"], help="seconds between streamed tokens")
+    args = parser.parse_args()
+    settings.update(delay=args.delay, jitter=args.jitter, fail_rate=args.fail_rate, token_delay=args.token_delay)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")